@@ -40,6 +40,8 @@ class App extends Component {
   }
 
   handleCheckoutModalShow(){
+    // one key per checkout attempt, so resubmitting after a network error can't create a second order
+    this.checkoutIdempotencyKey = `${Date.now()}-${Math.random().toString(36).slice(2)}`;
     this.setState({checkoutModalActive: true});
   }
 
@@ -69,6 +71,7 @@ class App extends Component {
           'Accept': 'application/json',
           'Content-Type': 'application/json',
           'X-CSRFToken': csrfToken,
+          'Idempotency-Key': this.checkoutIdempotencyKey,
         },
         body: JSON.stringify(data),
       });
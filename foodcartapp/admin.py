@@ -9,6 +9,7 @@ from .models import ProductCategory
 from .models import Restaurant
 from .models import RestaurantMenuItem
 from .models import Order, OrderPosition
+from .models import GeocodeJob
 
 
 class RestaurantMenuItemInline(admin.TabularInline):
@@ -114,11 +115,34 @@ class InlineOrderPosition(admin.TabularInline):
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
     raw_id_fields = ['restaurant']
+    list_display = [
+        '__str__',
+        'status',
+        'address',
+        'total_amount',
+        'created_time',
+    ]
+    list_filter = [
+        'status',
+    ]
+    readonly_fields = [
+        'total_amount',
+        'candidates_updated_time',
+    ]
 
     inlines = [
         InlineOrderPosition
     ]
 
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        orders = Order.objects.filter(pk=form.instance.pk)
+        orders.recalculate_total_amount()
+        if 'address' in form.changed_data:
+            # restaurants for the old address must not outlive it
+            orders.expire_candidates()
+        orders.update_restaurant_candidates()
+
     def response_change(self, request, obj):
         response = super().response_change(request, obj)
         if "next" in request.GET and url_has_allowed_host_and_scheme(request.GET['next'], None):
@@ -127,4 +151,20 @@ class OrderAdmin(admin.ModelAdmin):
         return response
 
 
+@admin.register(GeocodeJob)
+class GeocodeJobAdmin(admin.ModelAdmin):
+    list_display = [
+        'address',
+        'created_time',
+        'processed_time',
+        'attempts',
+    ]
+    list_filter = [
+        'processed_time',
+    ]
+    search_fields = [
+        'address',
+    ]
+
+
 admin.site.register(ProductCategory)
\ No newline at end of file
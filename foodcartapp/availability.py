@@ -0,0 +1,48 @@
+from collections import defaultdict
+
+
+class AvailabilityIndex:
+    """Restaurants that have a product on sale, as one bitmask per product.
+
+    Bit `i` of a mask stands for `restaurant_ids[i]`, so finding the
+    restaurants that can cook every product of an order takes one AND
+    per product.
+    """
+
+    def __init__(self, menu_items):
+        menu_items = list(menu_items)
+        self.restaurant_ids = sorted({restaurant for product, restaurant in menu_items})
+        self.restaurant_bits = {
+            restaurant: 1 << bit for bit, restaurant in enumerate(self.restaurant_ids)
+        }
+
+        self.product_masks = defaultdict(int)
+        for product, restaurant in menu_items:
+            self.product_masks[product] |= self.restaurant_bits[restaurant]
+
+    def get_mask(self, product_ids):
+        product_ids = list(product_ids)
+        if not product_ids:
+            return 0
+
+        mask = (1 << len(self.restaurant_ids)) - 1
+        for product_id in product_ids:
+            mask &= self.product_masks.get(product_id, 0)
+        return mask
+
+    def get_restaurant_ids(self, product_ids):
+        mask = self.get_mask(product_ids)
+        restaurant_ids = set()
+        while mask:
+            lowest_bit = mask & -mask
+            restaurant_ids.add(self.restaurant_ids[lowest_bit.bit_length() - 1])
+            mask ^= lowest_bit
+        return restaurant_ids
+
+    def get_row(self, product_id, restaurant_ids):
+        """Whether each of `restaurant_ids`, in that order, has the product on sale."""
+        mask = self.product_masks.get(product_id, 0)
+        return [
+            bool(mask & self.restaurant_bits.get(restaurant_id, 0))
+            for restaurant_id in restaurant_ids
+        ]
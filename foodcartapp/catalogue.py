@@ -0,0 +1,112 @@
+import hashlib
+import time
+from datetime import datetime, timezone
+
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from star_burger.settings import CATALOGUE_CACHE_TIMEOUT
+
+from .models import Product, ProductCategory, RestaurantMenuItem
+from .streaming import iter_json_array
+
+
+CATALOGUE_VERSION_KEY = 'catalogue:version'
+CATALOGUE_CHUNK_SIZE = 500
+
+
+def dump_product(product):
+    return {
+        'id': product.id,
+        'name': product.name,
+        'price': product.price,
+        'special_status': product.special_status,
+        'description': product.description,
+        'category': {
+            'id': product.category.id,
+            'name': product.category.name,
+        } if product.category else None,
+        'image': product.image.url,
+        'restaurant': {
+            'id': product.id,
+            'name': product.name,
+        }
+    }
+
+
+def dump_catalogue():
+    products = Product.objects \
+        .select_related('category') \
+        .available() \
+        .iterator(chunk_size=CATALOGUE_CHUNK_SIZE)
+    return b''.join(iter_json_array(map(dump_product, products)))
+
+
+def bump_catalogue_version():
+    version = time.time_ns()
+    cache.set(CATALOGUE_VERSION_KEY, version, CATALOGUE_CACHE_TIMEOUT)
+    return version
+
+
+def get_catalogue_version():
+    return cache.get(CATALOGUE_VERSION_KEY) or bump_catalogue_version()
+
+
+def render_catalogue(version):
+    payload = dump_catalogue()
+    headers = {
+        'version': version,
+        'etag': hashlib.sha1(payload).hexdigest(),
+        'last_modified': datetime.fromtimestamp(version / 10 ** 9, timezone.utc),
+    }
+    cache.set_many({
+        f'catalogue:{version}': payload,
+        f'catalogue:{version}:headers': headers,
+    }, CATALOGUE_CACHE_TIMEOUT)
+    return payload, headers
+
+
+def get_catalogue_headers():
+    """Return the current catalogue version with its ETag and modification time.
+
+    The catalogue is stored under the current version key, so a bumped
+    version makes the old payload unreachable without deleting it. The
+    headers are kept apart from the payload, so a conditional request
+    is answered without loading the whole catalogue.
+    """
+    version = get_catalogue_version()
+    headers = cache.get(f'catalogue:{version}:headers')
+    if headers is None:
+        payload, headers = render_catalogue(version)
+    return headers
+
+
+def get_catalogue_payload(version):
+    payload = cache.get(f'catalogue:{version}')
+    if payload is None:
+        payload, headers = render_catalogue(version)
+    return payload
+
+
+def get_product_prices(product_ids):
+    """Return current prices of the given products that exist, by product id.
+
+    Prices are read from the database rather than the catalogue cache:
+    a cache kept in another process may still hold the old prices.
+    """
+    return dict(
+        Product.objects
+        .filter(id__in=product_ids)
+        .values_list('id', 'price')
+    )
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=ProductCategory)
+@receiver(post_delete, sender=ProductCategory)
+@receiver(post_save, sender=RestaurantMenuItem)
+@receiver(post_delete, sender=RestaurantMenuItem)
+def expire_catalogue(sender, **kwargs):
+    bump_catalogue_version()
@@ -0,0 +1,118 @@
+from collections import defaultdict
+
+import numpy as np
+from geopy import distance
+
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+def as_points_array(points):
+    return np.asarray(points, dtype=float).reshape(-1, 2)
+
+
+def haversine_matrix(from_points, to_points):
+    """Great-circle distances in km between every pair of `(lon, lat)` points."""
+    from_points = np.radians(as_points_array(from_points))
+    to_points = np.radians(as_points_array(to_points))
+
+    from_lon, from_lat = from_points[:, [0]], from_points[:, [1]]
+    to_lon, to_lat = to_points[:, 0], to_points[:, 1]
+
+    haversine = np.sin((to_lat - from_lat) / 2) ** 2 \
+        + np.cos(from_lat) * np.cos(to_lat) * np.sin((to_lon - from_lon) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(haversine))
+
+
+def geodesic_matrix(from_points, to_points):
+    """Same as `haversine_matrix`, but with exact geodesic distances."""
+    from_points = as_points_array(from_points)
+    to_points = as_points_array(to_points)
+    return np.array([
+        [
+            distance.distance((from_lat, from_lon), (to_lat, to_lon)).km
+            for to_lon, to_lat in to_points
+        ]
+        for from_lon, from_lat in from_points
+    ]).reshape(len(from_points), len(to_points))
+
+
+DISTANCE_MATRIX_FUNCTIONS = {
+    'haversine': haversine_matrix,
+    'geodesic': geodesic_matrix,
+}
+
+
+def distance_matrix(from_points, to_points, mode='haversine'):
+    return DISTANCE_MATRIX_FUNCTIONS[mode](from_points, to_points)
+
+
+class RestaurantIndex:
+    """Grid over restaurant points for "k nearest within radius" queries.
+
+    Cells are at least `cell_size_km` wide, so a radius query only looks
+    at the restaurants of the cells around the order point.
+    """
+
+    def __init__(self, restaurant_ids, points, cell_size_km=5, mode='haversine'):
+        self.restaurant_ids = np.asarray(restaurant_ids, dtype=int)
+        self.points = as_points_array(points)
+        self.cell_size_km = cell_size_km
+        self.mode = mode
+
+        self.lat_step = np.degrees(cell_size_km / EARTH_RADIUS_KM)
+        max_lat = min(np.abs(self.points[:, 1]).max(initial=0), 89)
+        self.lon_step = self.lat_step / np.cos(np.radians(max_lat))
+
+        cells = defaultdict(list)
+        for index, (lon, lat) in enumerate(self.points):
+            cells[self.get_cell(lon, lat)].append(index)
+        self.cells = {cell: np.array(indexes) for cell, indexes in cells.items()}
+
+    def get_cell(self, lon, lat):
+        return int(lon // self.lon_step), int(lat // self.lat_step)
+
+    def get_candidates(self, point, radius_km=None):
+        if radius_km is None:
+            return np.arange(len(self.restaurant_ids))
+
+        lon_cell, lat_cell = self.get_cell(*point)
+        reach = int(np.ceil(radius_km / self.cell_size_km))
+        if (2 * reach + 1) ** 2 < len(self.cells):
+            nearby_cells = (
+                (lon_cell + lon_shift, lat_cell + lat_shift)
+                for lon_shift in range(-reach, reach + 1)
+                for lat_shift in range(-reach, reach + 1)
+            )
+        else:
+            nearby_cells = (
+                (cell_lon, cell_lat) for cell_lon, cell_lat in self.cells
+                if abs(cell_lon - lon_cell) <= reach
+                and abs(cell_lat - lat_cell) <= reach
+            )
+        candidates = [
+            self.cells[cell] for cell in nearby_cells if cell in self.cells
+        ]
+        if not candidates:
+            return np.array([], dtype=int)
+        return np.concatenate(candidates)
+
+    def nearest(self, point, allowed_ids=None, count=None, radius_km=None):
+        """Return `(restaurant_ids, distances)` sorted by distance."""
+        candidates = self.get_candidates(point, radius_km)
+        if allowed_ids is not None:
+            allowed = np.isin(self.restaurant_ids[candidates], list(allowed_ids))
+            candidates = candidates[allowed]
+        if not len(candidates):
+            return np.array([], dtype=int), np.array([])
+
+        distances = distance_matrix(point, self.points[candidates], self.mode)[0]
+        if radius_km is not None:
+            within_radius = distances <= radius_km
+            candidates, distances = candidates[within_radius], distances[within_radius]
+        if count is not None and count < len(candidates):
+            closest = np.argpartition(distances, count)[:count]
+            candidates, distances = candidates[closest], distances[closest]
+
+        order = np.argsort(distances)
+        return self.restaurant_ids[candidates[order]], distances[order]
@@ -1,14 +1,361 @@
+import csv
+import hashlib
+import random
+import re
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from threading import Lock
+from urllib.parse import urlparse
+
 import requests
+from django.core.exceptions import ImproperlyConfigured
+from requests.adapters import HTTPAdapter
 
-def fetch_coordinates(apikey, place):
-    base_url = "https://geocode-maps.yandex.ru/1.x"
-    params = {"geocode": place, "apikey": apikey, "format": "json"}
-    response = requests.get(base_url, params=params)
-    response.raise_for_status()
-    found_places = response.json()['response']['GeoObjectCollection']['featureMember']
+from .metrics import metrics
+
+
+YANDEX_GEOCODER_URL = "https://geocode-maps.yandex.ru/1.x"
+
+
+def normalize_address(address):
+    """Canonical key of an address: case, spacing and `ё` do not matter."""
+    address = address.casefold().replace('ё', 'е')
+    address = re.sub(r'\s*,\s*', ', ', address)
+    return ' '.join(address.split()).strip(' ,')
+
+
+def hash_coordinates(address, bbox=(37.35, 55.55, 37.85, 55.95)):
+    """Made-up but stable `(lon, lat)` of an address inside `bbox`, for offline runs."""
+    digest = hashlib.sha1(normalize_address(address).encode()).digest()
+    min_lon, min_lat, max_lon, max_lat = bbox
+    lon_share = int.from_bytes(digest[:4], 'big') / 0xFFFFFFFF
+    lat_share = int.from_bytes(digest[4:8], 'big') / 0xFFFFFFFF
+    return (
+        round(min_lon + lon_share * (max_lon - min_lon), 6),
+        round(min_lat + lat_share * (max_lat - min_lat), 6),
+    )
+
+
+class GeocodeCache:
+    """In-process LRU tier in front of the MapPoint table.
+
+    Keys are normalized addresses, values are `((lon, lat), last_update)`
+    pairs, where `(None, None)` means the geocoder did not find the address.
+    """
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self._items = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, address):
+        with self._lock:
+            if address not in self._items:
+                return None
+            self._items.move_to_end(address)
+            return self._items[address]
+
+    def set(self, address, point, last_update):
+        with self._lock:
+            self._items[address] = (point, last_update)
+            self._items.move_to_end(address)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def invalidate(self, address):
+        with self._lock:
+            self._items.pop(address, None)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+
+class RateLimiter:
+    """Spaces out calls so that no more than `rate` start per second."""
+
+    def __init__(self, rate):
+        self.interval = 1 / rate if rate else 0
+        self._next_call = time.monotonic()
+        self._lock = Lock()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            delay = self._next_call - now
+            self._next_call = max(now, self._next_call) + self.interval
+        if delay > 0:
+            time.sleep(delay)
+
+
+_rate_limiters = {}
+_rate_limiters_lock = Lock()
+
+
+def get_rate_limiter(url, rate):
+    host = urlparse(url).netloc
+    with _rate_limiters_lock:
+        if host not in _rate_limiters:
+            _rate_limiters[host] = RateLimiter(rate)
+        return _rate_limiters[host]
+
+
+class GeocoderResponseError(requests.RequestException):
+    """The geocoder answered, but not with the JSON we expect."""
+
+
+def parse_coordinates(payload):
+    found_places = payload['response']['GeoObjectCollection']['featureMember']
+    if not found_places:
+        return {
+            'lon': None,
+            'lat': None
+        }
     most_relevant = found_places[0]
     lon, lat = most_relevant['GeoObject']['Point']['pos'].split(" ")
     return {
         'lon': float(lon),
         'lat': float(lat)
-    }
\ No newline at end of file
+    }
+
+
+def fetch_coordinates(apikey, place, base_url=YANDEX_GEOCODER_URL, session=requests,
+                      timeout=None):
+    params = {"geocode": place, "apikey": apikey, "format": "json"}
+    started_at = time.perf_counter()
+    outcome = 'error'
+    try:
+        response = session.get(base_url, params=params, timeout=timeout)
+        response.raise_for_status()
+        try:
+            coordinates = parse_coordinates(response.json())
+        except (ValueError, LookupError, TypeError, AttributeError) as error:
+            raise GeocoderResponseError(
+                f'неожиданный ответ геокодера: {error!r}', response=response
+            ) from error
+        outcome = 'ok'
+    finally:
+        metrics.observe(
+            'geocoder_request_duration_seconds',
+            time.perf_counter() - started_at,
+            outcome=outcome,
+        )
+    return coordinates
+
+
+class GeocoderUnavailable(requests.RequestException):
+    """The circuit breaker is open, so the geocoder was not called."""
+
+
+class CircuitBreaker:
+    """Stops calls to an upstream after `failure_threshold` failures in a row.
+
+    Once `reset_timeout` seconds have passed, one trial call goes through:
+    its success closes the circuit, its failure opens it again.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+        self._lock = Lock()
+
+    @property
+    def is_open(self):
+        with self._lock:
+            return self.opened_at is not None \
+                and time.monotonic() < self.opened_at + self.reset_timeout
+
+    def allow_request(self):
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if self._trial_running \
+                    or time.monotonic() < self.opened_at + self.reset_timeout:
+                return False
+            self._trial_running = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_running = False
+            if self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+
+class RetryBudget:
+    """Caps retries at `ratio` of first attempts.
+
+    Every first attempt deposits `ratio` of a token and every retry takes
+    a whole one, so a failing upstream gets about `1 + ratio` calls per
+    request instead of `1 + retries`.
+    """
+
+    def __init__(self, ratio=0.2, max_tokens=10):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self.tokens = max_tokens
+        self._lock = Lock()
+
+    def deposit(self):
+        with self._lock:
+            self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def withdraw(self):
+        with self._lock:
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+
+def is_retriable(error):
+    if isinstance(error, requests.HTTPError):
+        status_code = error.response.status_code
+        return status_code == 429 or status_code >= 500
+    return isinstance(error, (requests.ConnectionError, requests.Timeout))
+
+
+class GeocoderClient:
+    """Geocoder over one keep-alive session, with timeouts and retries.
+
+    Failed calls are retried with jittered exponential backoff while the
+    retry budget allows. After repeated failures the circuit breaker makes
+    calls fail fast with `GeocoderUnavailable`, so callers can fall back
+    to what they already know instead of waiting on a degraded upstream.
+    """
+
+    def __init__(self, apikey, base_url=YANDEX_GEOCODER_URL, timeout=(3, 10),
+                 retries=2, backoff=0.5, rate=10, workers=4,
+                 circuit_breaker=None, retry_budget=None):
+        self.apikey = apikey
+        self.base_url = base_url
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.rate = rate
+        self.workers = workers
+        self.circuit_breaker = circuit_breaker or CircuitBreaker()
+        self.retry_budget = retry_budget or RetryBudget()
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    @property
+    def is_available(self):
+        return not self.circuit_breaker.is_open
+
+    def fetch_coordinates(self, place):
+        if not self.apikey:
+            raise ImproperlyConfigured('Не задан ключ геокодера YANDEX_API_KEY')
+        if not self.circuit_breaker.allow_request():
+            metrics.inc('geocoder_rejected_total')
+            raise GeocoderUnavailable(f'геокодер {self.base_url} недоступен')
+
+        rate_limiter = get_rate_limiter(self.base_url, self.rate)
+        self.retry_budget.deposit()
+        for attempt in range(self.retries + 1):
+            rate_limiter.wait()
+            try:
+                coordinates = fetch_coordinates(
+                    self.apikey, place, self.base_url, self.session, self.timeout
+                )
+            except requests.RequestException as error:
+                if attempt == self.retries or not is_retriable(error) \
+                        or not self.retry_budget.withdraw():
+                    self.circuit_breaker.record_failure()
+                    raise
+                metrics.inc('geocoder_retries_total')
+                time.sleep(random.uniform(0, self.backoff * 2 ** attempt))
+            except Exception:
+                # a half-open circuit waits for the outcome of its trial call
+                self.circuit_breaker.record_failure()
+                raise
+            else:
+                self.circuit_breaker.record_success()
+                return coordinates
+
+    def fetch_many_coordinates(self, places):
+        """Geocode places concurrently.
+
+        Returns a dict of place -> coordinates for the places that were
+        geocoded; places that failed are left out, so the caller can retry
+        them later.
+        """
+        coordinates = {}
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = {
+                executor.submit(self.fetch_coordinates, place): place
+                for place in places
+            }
+            for future in as_completed(futures):
+                try:
+                    coordinates[futures[future]] = future.result()
+                except requests.RequestException:
+                    continue
+        return coordinates
+
+
+class OfflineGeocoder:
+    """Geocoder without network access, for local runs and CI.
+
+    Addresses are looked up in an in-memory table loaded from a CSV file
+    with `address,lon,lat` columns. Addresses missing from the table get
+    made-up coordinates from `hash_coordinates`, or are reported as not
+    found when `fallback` is off.
+    """
+
+    is_available = True
+
+    def __init__(self, path=None, fallback=True):
+        self.fallback = fallback
+        self.points = {}
+        if path:
+            with open(path, encoding='utf-8', newline='') as rows:
+                for row in csv.DictReader(rows):
+                    self.points[normalize_address(row['address'])] = (
+                        float(row['lon']), float(row['lat'])
+                    )
+
+    def fetch_coordinates(self, place):
+        point = self.points.get(normalize_address(place))
+        if point is None and self.fallback:
+            point = hash_coordinates(place)
+        lon, lat = point or (None, None)
+        return {'lon': lon, 'lat': lat}
+
+    def fetch_many_coordinates(self, places):
+        return {place: self.fetch_coordinates(place) for place in places}
+
+
+GEOCODER_BACKENDS = ['yandex', 'stub', 'offline']
+
+
+def make_geocoder(backend, apikey=None, base_url=YANDEX_GEOCODER_URL,
+                  offline_file=None, offline_fallback=True, **client_options):
+    """Geocoder for the `GEOCODER_BACKEND` setting.
+
+    `yandex` is the real API, `stub` is the same protocol served by
+    `run_geocoder_stub` and needs no key, `offline` makes no requests at all.
+    """
+    if backend == 'yandex':
+        return GeocoderClient(apikey, base_url, **client_options)
+    if backend == 'stub':
+        return GeocoderClient(apikey or 'stub', base_url, **client_options)
+    if backend == 'offline':
+        return OfflineGeocoder(offline_file, offline_fallback)
+    raise ImproperlyConfigured(
+        f'Неизвестный геокодер {backend}, доступны: {", ".join(GEOCODER_BACKENDS)}'
+    )
@@ -0,0 +1,76 @@
+"""Local stand-in for the Yandex geocoder HTTP API, for load tests and tests without network."""
+import json
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from .geo_utils import hash_coordinates, normalize_address
+
+
+class GeocoderStubHandler(BaseHTTPRequestHandler):
+    """Answers like the geocoder, with the faults set on the server.
+
+    `server.failures` holds the next responses to fail with, each a status
+    code or a `(status, body)` pair; `server.delay` slows every answer down.
+    """
+
+    def do_GET(self):
+        query = parse_qs(urlparse(self.path).query)
+        place = query.get('geocode', [''])[0]
+        if self.server.requested_places is not None:
+            self.server.requested_places.append(place)
+
+        if self.server.failures:
+            failure = self.server.failures.pop(0)
+            status, body = failure if isinstance(failure, tuple) else (failure, b'')
+            self.send_body(status, body)
+            return
+        time.sleep(self.server.delay)
+
+        point = self.find_point(place)
+        self.send_body(200, json.dumps({
+            'response': {
+                'GeoObjectCollection': {
+                    'featureMember': [
+                        {'GeoObject': {'Point': {'pos': f'{point[0]} {point[1]}'}}}
+                    ] if point else []
+                }
+            }
+        }).encode(), content_type='application/json')
+
+    def find_point(self, place):
+        address_key = normalize_address(place)
+        if address_key in self.server.places:
+            return self.server.places[address_key]
+        return hash_coordinates(place) if place else None
+
+    def send_body(self, status, body, content_type='text/html'):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        try:
+            self.wfile.write(body)
+        except ConnectionError:
+            pass  # the client has timed out
+
+    def log_message(self, format, *args):
+        pass
+
+
+def make_geocoder_stub(host='127.0.0.1', port=0, delay=0, places=None,
+                       record_requests=False):
+    """Geocoder stub server; call `serve_forever` to start it.
+
+    `places` maps normalized addresses to `(lon, lat)`, or to None for
+    addresses the geocoder does not find; other addresses get made-up
+    coordinates from `hash_coordinates`. With `record_requests`, the
+    requested places are kept in `server.requested_places`.
+    """
+    server = ThreadingHTTPServer((host, port), GeocoderStubHandler)
+    server.daemon_threads = True
+    server.delay = delay
+    server.places = places or {}
+    server.failures = []
+    server.requested_places = [] if record_requests else None
+    return server
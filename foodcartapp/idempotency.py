@@ -0,0 +1,75 @@
+import hashlib
+import json
+from datetime import timedelta
+from functools import wraps
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from star_burger.settings import IDEMPOTENCY_KEY_TTL
+
+from .models import IdempotencyKey
+
+
+def get_request_hash(request):
+    payload = json.dumps(request.data, sort_keys=True, cls=DjangoJSONEncoder)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def replay_response(idempotency_key, request_hash):
+    if idempotency_key.request_hash != request_hash:
+        return Response(
+            {'error': 'Idempotency-Key уже использован для другого запроса'},
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+        )
+    return Response(
+        json.loads(idempotency_key.response_body),
+        status=idempotency_key.response_status,
+        headers={'Idempotent-Replayed': 'true'},
+    )
+
+
+def idempotent(view):
+    """Replay the saved response for a repeated `Idempotency-Key` header.
+
+    The key is claimed in the same transaction as the view's writes, so a
+    concurrent duplicate waits on the unique index and then gets the
+    response of the request that won.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        key = request.headers.get('Idempotency-Key')
+        if not key:
+            return view(request, *args, **kwargs)
+
+        request_hash = get_request_hash(request)
+        with transaction.atomic():
+            IdempotencyKey.objects.expired().filter(key=key).delete()
+            try:
+                with transaction.atomic():
+                    idempotency_key = IdempotencyKey.objects.create(
+                        key=key,
+                        request_hash=request_hash,
+                        expires_time=timezone.now() + timedelta(seconds=IDEMPOTENCY_KEY_TTL),
+                    )
+            except IntegrityError:
+                return replay_response(
+                    IdempotencyKey.objects.get(key=key), request_hash
+                )
+
+            response = view(request, *args, **kwargs)
+            if response.status_code >= 400:
+                transaction.set_rollback(True)
+                return response
+
+            idempotency_key.response_status = response.status_code
+            idempotency_key.response_body = json.dumps(
+                response.data, cls=DjangoJSONEncoder
+            )
+            idempotency_key.save(update_fields=['response_status', 'response_body'])
+            return response
+
+    return wrapper
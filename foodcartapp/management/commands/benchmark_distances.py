@@ -0,0 +1,53 @@
+import random
+import time
+
+from geopy import distance
+
+from django.core.management.base import BaseCommand
+
+from foodcartapp.distances import distance_matrix
+from foodcartapp.synthetic import clustered_points
+
+
+def geopy_loop(order_points, restaurant_points):
+    return [
+        [
+            distance.distance((order_lat, order_lon), (restaurant_lat, restaurant_lon)).km
+            for restaurant_lon, restaurant_lat in restaurant_points
+        ]
+        for order_lon, order_lat in order_points
+    ]
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает скорость расчёта расстояний от заказов до ресторанов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=1000)
+        parser.add_argument('--restaurants', type=int, default=200)
+        parser.add_argument('--clusters', type=int, default=5)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        order_points = clustered_points(options['orders'], options['clusters'], rng)
+        restaurant_points = clustered_points(
+            options['restaurants'], options['clusters'], rng, spread=0.05
+        )
+
+        benchmarks = [
+            ('geopy, по одной паре', lambda: geopy_loop(order_points, restaurant_points)),
+            ('numpy, haversine', lambda: distance_matrix(order_points, restaurant_points)),
+            ('numpy, geodesic', lambda: distance_matrix(
+                order_points, restaurant_points, mode='geodesic'
+            )),
+        ]
+
+        self.stdout.write(
+            f'{options["orders"]} заказов × {options["restaurants"]} ресторанов'
+        )
+        for title, benchmark in benchmarks:
+            started_at = time.perf_counter()
+            benchmark()
+            elapsed = time.perf_counter() - started_at
+            self.stdout.write(f'{title}: {elapsed:.3f} с')
@@ -0,0 +1,82 @@
+import json
+import random
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test import Client
+
+from foodcartapp.models import GeocodeJob, Order, OrderEvent, Product
+
+
+class Command(BaseCommand):
+    help = 'Замеряет, сколько заказов в секунду принимает /api/order/ без сети'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=1000)
+        parser.add_argument('--products', type=int, default=30)
+        parser.add_argument('--cart-size', type=int, default=3)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--host', default='127.0.0.1',
+            help='Имя сайта из ALLOWED_HOSTS для заголовка Host',
+        )
+
+    def handle(self, *args, **options):
+        if settings.DEBUG:
+            self.stderr.write(
+                'DEBUG=True: django-debug-toolbar записывает каждый SQL-запрос, '
+                'замер будет занижен'
+            )
+        random.seed(options['seed'])
+        client = Client(HTTP_HOST=options['host'])
+
+        last_job_id = GeocodeJob.objects.order_by('-id').values_list('id', flat=True).first() or 0
+        Product.objects.bulk_create([
+            Product(name=f'Бургер {number}', price=random.randint(100, 500))
+            for number in range(options['products'])
+        ])
+        product_ids = list(
+            Product.objects.order_by('-id').values_list('id', flat=True)[:options['products']]
+        )
+
+        payloads = [
+            json.dumps({
+                'products': [
+                    {'product': product_id, 'quantity': random.randint(1, 3)}
+                    for product_id in random.sample(
+                        product_ids, min(options['cart_size'], len(product_ids))
+                    )
+                ],
+                'firstname': 'Иван',
+                'lastname': 'Петров',
+                'phonenumber': '+79291234567',
+                'address': f'Москва, Тверская {random.randint(1, 200)}',
+            })
+            for _ in range(options['orders'])
+        ]
+
+        order_ids = []
+        try:
+            # every order is committed on its own and goes through the
+            # URL routing and middleware, as a request to the site would
+            started_at = time.perf_counter()
+            for payload in payloads:
+                response = client.post(
+                    '/api/order/', payload, content_type='application/json'
+                )
+                assert response.status_code == 200, response.content
+                order_ids.append(response.json()['id'])
+            elapsed = time.perf_counter() - started_at
+        finally:
+            Order.objects.filter(id__in=order_ids).delete()
+            OrderEvent.objects.filter(order_id__in=order_ids).delete()
+            GeocodeJob.objects.filter(
+                id__gt=last_job_id, address__startswith='Москва, Тверская '
+            ).delete()
+            Product.objects.filter(id__in=product_ids).delete()
+
+        self.stdout.write(
+            f'Принято заказов: {options["orders"]} за {elapsed:.2f} с, '
+            f'{options["orders"] / elapsed:.0f} заказов в секунду'
+        )
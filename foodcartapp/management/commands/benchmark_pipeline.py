@@ -0,0 +1,207 @@
+import json
+import platform
+import random
+import statistics
+import subprocess
+import time
+
+import django
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import RequestFactory
+from rest_framework.test import APIRequestFactory
+
+from foodcartapp.catalogue import bump_catalogue_version
+from foodcartapp.models import Order
+from foodcartapp.synthetic import create_catalogue, create_orders, generate_addresses
+from foodcartapp.synthetic import random_cart, reset_process_caches
+from foodcartapp.views import product_list_api, register_order
+from restaurateur.views import view_orders, view_products
+
+
+SCALES = {
+    'small': {'restaurants': 10, 'products': 50, 'orders': 200},
+    'medium': {'restaurants': 50, 'products': 200, 'orders': 2000},
+    'large': {'restaurants': 200, 'products': 500, 'orders': 10000},
+}
+
+
+def summarize(timings):
+    timings = sorted(timings)
+    return {
+        'runs': len(timings),
+        'mean_ms': round(statistics.mean(timings) * 1000, 3),
+        'median_ms': round(statistics.median(timings) * 1000, 3),
+        'p95_ms': round(timings[int(0.95 * (len(timings) - 1))] * 1000, 3),
+        'min_ms': round(timings[0] * 1000, 3),
+    }
+
+
+def measure(call, repeat, before_each=None):
+    timings = []
+    for _ in range(repeat):
+        if before_each:
+            before_each()
+        started_at = time.perf_counter()
+        response = call()
+        timings.append(time.perf_counter() - started_at)
+        assert response.status_code == 200, response.status_code
+    return summarize(timings)
+
+
+def get_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = 'Замеряет приём заказов, меню и страницы менеджера на синтетических данных'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--scale', action='append', choices=SCALES,
+            help='Размер данных, можно указать несколько раз. По умолчанию small и medium',
+        )
+        parser.add_argument('--menu-density', type=float, default=0.6)
+        parser.add_argument('--clusters', type=int, default=5)
+        parser.add_argument('--cart-size', type=int, default=3)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--output', default='-',
+            help='Куда записать отчёт в JSON, «-» — в консоль',
+        )
+        parser.add_argument(
+            '--compare',
+            help='Отчёт прошлого запуска, с которым сравнить медианы',
+        )
+
+    def handle(self, *args, **options):
+        report = {
+            'commit': get_commit(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'options': {
+                option: options[option]
+                for option in ['menu_density', 'clusters', 'cart_size', 'repeat', 'seed']
+            },
+            'scales': [],
+        }
+        for scale in options['scale'] or ['small', 'medium']:
+            self.stderr.write(f'Замеряю {scale}...')
+            report['scales'].append({
+                'scale': scale,
+                **SCALES[scale],
+                'results': self.run_scale(SCALES[scale], options),
+            })
+
+        encoded_report = json.dumps(report, ensure_ascii=False, indent=2)
+        if options['output'] == '-':
+            self.stdout.write(encoded_report)
+        else:
+            with open(options['output'], 'w', encoding='utf-8') as output:
+                output.write(encoded_report)
+
+        if options['compare']:
+            with open(options['compare'], encoding='utf-8') as previous:
+                self.compare(json.load(previous), report)
+
+    def run_scale(self, scale, options):
+        rng = random.Random(options['seed'])
+        factory = RequestFactory()
+        api_factory = APIRequestFactory()
+        repeat = options['repeat']
+
+        with transaction.atomic():
+            restaurant_ids, product_ids = create_catalogue(
+                scale['restaurants'],
+                scale['products'],
+                menu_density=options['menu_density'],
+                clusters=options['clusters'],
+                seed=options['seed'],
+            )
+            addresses = generate_addresses(
+                max(scale['orders'] // 2, 1), options['clusters'], options['seed']
+            )
+            create_orders(
+                scale['orders'], product_ids, addresses, options['cart_size'], options['seed']
+            )
+            manager = User.objects.create_user('benchmark_manager', is_staff=True)
+
+            def manager_request(path):
+                request = factory.get(path)
+                request.user = manager
+                return request
+
+            def expire_candidates():
+                Order.objects.update(candidates_updated_time=None)
+
+            results = {
+                'register_order': measure(
+                    lambda: register_order(api_factory.post('/api/order/', {
+                        'products': random_cart(product_ids, options['cart_size'], rng),
+                        'firstname': 'Иван',
+                        'lastname': 'Петров',
+                        'phonenumber': '+79291234567',
+                        'address': rng.choice(addresses),
+                    }, format='json')),
+                    repeat,
+                ),
+                'product_list_api': measure(
+                    lambda: product_list_api(factory.get('/api/products/')),
+                    repeat,
+                    before_each=bump_catalogue_version,
+                ),
+                'product_list_api_cached': measure(
+                    lambda: product_list_api(factory.get('/api/products/')),
+                    repeat,
+                ),
+                'view_products': measure(
+                    lambda: view_products(manager_request('/manager/products/')),
+                    repeat,
+                ),
+                'view_orders': measure(
+                    lambda: view_orders(manager_request('/manager/orders/')),
+                    repeat,
+                    before_each=expire_candidates,
+                ),
+                'fetch_restaurant_distance': summarize([
+                    self.time_fetch_restaurant_distance() for _ in range(max(repeat // 4, 1))
+                ]),
+            }
+            transaction.set_rollback(True)
+
+        reset_process_caches()
+        return results
+
+    def time_fetch_restaurant_distance(self):
+        orders = Order.objects.with_positions()
+        started_at = time.perf_counter()
+        orders.fetch_restaurant_distance()
+        return time.perf_counter() - started_at
+
+    def compare(self, previous_report, report):
+        previous_results = {
+            scale['scale']: scale['results'] for scale in previous_report['scales']
+        }
+        self.stderr.write(
+            f'Сравнение с {previous_report.get("commit")}, медианы в мс:'
+        )
+        for scale in report['scales']:
+            for benchmark, result in scale['results'].items():
+                previous = previous_results.get(scale['scale'], {}).get(benchmark)
+                if not previous:
+                    continue
+                change = (result['median_ms'] / previous['median_ms'] - 1) * 100 \
+                    if previous['median_ms'] else 0
+                self.stderr.write(
+                    f'{scale["scale"]:<7} {benchmark:<27} '
+                    f'{previous["median_ms"]:>10.2f} → {result["median_ms"]:>10.2f} '
+                    f'({change:+.0f}%)'
+                )
@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand
+from django.db.models import F
+
+from foodcartapp.models import Order
+
+
+class Command(BaseCommand):
+    help = 'Сверяет сохранённые суммы заказов с суммой их позиций'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--fix', action='store_true',
+            help='Пересчитать суммы заказов, которые не сходятся',
+        )
+
+    def handle(self, *args, **options):
+        mismatched_orders = Order.objects \
+            .total() \
+            .exclude(total_amount=F('total')) \
+            .values_list('id', 'total_amount', 'total')
+
+        mismatched_ids = []
+        for order_id, total_amount, total in mismatched_orders.iterator():
+            mismatched_ids.append(order_id)
+            self.stdout.write(
+                f'Заказ {order_id}: сохранено {total_amount}, по позициям {total}'
+            )
+
+        if not mismatched_ids:
+            self.stdout.write(self.style.SUCCESS('Все суммы заказов сходятся'))
+            return
+
+        if options['fix']:
+            Order.objects.filter(id__in=mismatched_ids).recalculate_total_amount()
+            self.stdout.write(self.style.SUCCESS(
+                f'Пересчитано заказов: {len(mismatched_ids)}'
+            ))
+        else:
+            self.stdout.write(self.style.ERROR(
+                f'Не сходится заказов: {len(mismatched_ids)}'
+            ))
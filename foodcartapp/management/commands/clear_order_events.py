@@ -0,0 +1,18 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from foodcartapp.models import OrderEvent
+
+
+class Command(BaseCommand):
+    help = 'Удаляет старые события заказов, по которым менеджеры получают обновления'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=int, default=24)
+
+    def handle(self, *args, **options):
+        created_time = timezone.now() - timedelta(hours=options['hours'])
+        deleted, _ = OrderEvent.objects.older_than(created_time).delete()
+        self.stdout.write(f'Удалено событий: {deleted}')
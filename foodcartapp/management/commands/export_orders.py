@@ -0,0 +1,26 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from foodcartapp.models import Order
+from foodcartapp.order_io import WRITERS, get_format, iterate_orders
+
+
+class Command(BaseCommand):
+    help = 'Выгружает заказы с позициями в JSONL или CSV'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл для выгрузки, "-" — стандартный вывод')
+        parser.add_argument('--format', choices=list(WRITERS))
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        write_orders = WRITERS[get_format(path, options['format'])]
+        orders = iterate_orders(Order.objects.all(), options['chunk_size'])
+
+        if path == '-':
+            write_orders(orders, sys.stdout)
+            return
+        with open(path, 'w', encoding='utf-8', newline='') as output:
+            write_orders(orders, output)
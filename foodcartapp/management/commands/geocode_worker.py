@@ -0,0 +1,106 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from foodcartapp.metrics import save_metrics
+from foodcartapp.models import GeocodeJob, MapPoint, Order
+from foodcartapp.models import clear_process_indexes, geocoder
+
+
+class Command(BaseCommand):
+    help = 'Геокодирует адреса из очереди задач GeocodeJob'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Обработать очередь один раз и завершиться',
+        )
+        parser.add_argument('--batch-size', type=int, default=50)
+        parser.add_argument(
+            '--sleep', type=float, default=2,
+            help='Пауза в секундах, если очередь пуста',
+        )
+        parser.add_argument(
+            '--max-attempts', type=int, default=5,
+            help='После стольких неудачных попыток задача закрывается с ошибкой',
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            processed = self.process_batch(
+                options['batch_size'], options['max_attempts']
+            )
+            # also on idle passes: menu and restaurant changes expire orders too
+            self.update_stale_candidates(options['batch_size'])
+            save_metrics()
+            if options['once'] and not processed:
+                break
+            if not processed:
+                time.sleep(options['sleep'])
+
+    def process_batch(self, batch_size, max_attempts):
+        if not geocoder.is_available:
+            # don't spend the jobs' attempts while the geocoder is down
+            return 0
+
+        jobs = list(
+            GeocodeJob.objects
+            .pending()
+            .order_by('created_time')[:batch_size]
+        )
+        if not jobs:
+            return 0
+
+        points = MapPoint.objects.resolve_many(job.address for job in jobs)
+
+        now = timezone.now()
+        processed = 0
+        for job in jobs:
+            job.attempts += 1
+            if job.address in points:
+                job.processed_time = now
+                job.error = ''
+                processed += 1
+            elif job.attempts >= max_attempts:
+                # close the job, so the address can be queued again later
+                job.processed_time = now
+                job.error = 'Геокодер недоступен, попытки исчерпаны'
+            else:
+                job.error = 'Геокодер недоступен'
+        GeocodeJob.objects.bulk_update(
+            jobs, ['attempts', 'processed_time', 'error']
+        )
+
+        if processed:
+            self.stdout.write(f'Геокодировано адресов: {processed}')
+        return processed
+
+    def update_stale_candidates(self, batch_size):
+        stale_orders = Order.objects.unfinished().stale_candidates().order_by('id')
+        if not stale_orders.exists():
+            return 0
+        # menu and restaurant changes are signalled in the web processes
+        clear_process_indexes()
+
+        ranked = 0
+        last_id = 0
+        while True:
+            order_ids = list(
+                stale_orders
+                .filter(id__gt=last_id)
+                .values_list('id', flat=True)[:batch_size]
+            )
+            if not order_ids:
+                break
+            # addresses whose jobs ran out of attempts are queued again
+            # only when a manager opens their orders
+            ranked_orders = Order.objects \
+                .filter(id__in=order_ids) \
+                .update_restaurant_candidates(enqueue_unknown=False)
+            ranked += len(ranked_orders)
+            last_id = order_ids[-1]
+
+        if ranked:
+            self.stdout.write(f'Подобраны рестораны для заказов: {ranked}')
+        return ranked
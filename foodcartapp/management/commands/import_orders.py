@@ -0,0 +1,29 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from foodcartapp.order_io import READERS, get_format, import_orders
+
+
+class Command(BaseCommand):
+    help = 'Загружает заказы с позициями из JSONL или CSV'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл с заказами, "-" — стандартный ввод')
+        parser.add_argument('--format', choices=list(READERS))
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        read_orders = READERS[get_format(path, options['format'])]
+
+        try:
+            if path == '-':
+                imported = import_orders(read_orders(sys.stdin), options['batch_size'])
+            else:
+                with open(path, encoding='utf-8', newline='') as lines:
+                    imported = import_orders(read_orders(lines), options['batch_size'])
+        except (ValueError, KeyError) as error:
+            raise CommandError(f'Не удалось загрузить заказы: {error}')
+
+        self.stdout.write(f'Загружено заказов: {imported}')
@@ -0,0 +1,200 @@
+import json
+import math
+import queue
+import random
+import statistics
+import threading
+import time
+import uuid
+from collections import defaultdict
+
+import requests
+from django.core.management.base import BaseCommand
+
+from foodcartapp.synthetic import client_addresses, create_catalogue
+from foodcartapp.synthetic import generate_addresses, random_cart
+
+
+ENDPOINTS = ['/api/banners/', '/api/products/', '/api/order/']
+LATE_VISIT_DELAY = 1
+
+
+def percentile(sorted_values, quantile):
+    if not sorted_values:
+        return None
+    rank = max(math.ceil(quantile * len(sorted_values)) - 1, 0)
+    return sorted_values[rank]
+
+
+class LoadStats:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def record(self, endpoint, elapsed, ok):
+        with self._lock:
+            self.latencies[endpoint].append(elapsed)
+            if not ok:
+                self.errors[endpoint] += 1
+
+    def summarize(self, elapsed):
+        summary = {}
+        for endpoint in ENDPOINTS:
+            latencies = sorted(self.latencies[endpoint])
+            if not latencies:
+                continue
+            summary[endpoint] = {
+                'requests': len(latencies),
+                'errors': self.errors[endpoint],
+                'error_rate': round(self.errors[endpoint] / len(latencies), 4),
+                'throughput_rps': round(len(latencies) / elapsed, 2),
+                'mean_ms': round(statistics.mean(latencies) * 1000, 2),
+                **{
+                    f'p{round(quantile * 100)}_ms': round(percentile(latencies, quantile) * 1000, 2)
+                    for quantile in [0.5, 0.95, 0.99]
+                },
+            }
+        return summary
+
+
+class Command(BaseCommand):
+    help = 'Нагружает сайт визитами покупателей: баннеры, меню и заказ, как делает фронтенд'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000')
+        parser.add_argument('--concurrency', type=int, default=10)
+        parser.add_argument(
+            '--rate', type=float, default=0,
+            help='Сколько визитов в секунду начинать. 0 — каждый поток без пауз',
+        )
+        parser.add_argument('--duration', type=float, default=30)
+        parser.add_argument(
+            '--order-ratio', type=float, default=0.3,
+            help='Доля визитов, которые заканчиваются заказом',
+        )
+        parser.add_argument('--cart-size', type=int, default=3)
+        parser.add_argument('--addresses', type=int, default=1000)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--create-catalogue', action='store_true',
+            help='Сначала создать в базе рестораны, меню и координаты адресов',
+        )
+        parser.add_argument('--restaurants', type=int, default=20)
+        parser.add_argument('--products', type=int, default=100)
+        parser.add_argument('--output', help='Файл для отчёта в JSON')
+
+    def handle(self, *args, **options):
+        if options['create_catalogue']:
+            create_catalogue(options['restaurants'], options['products'], seed=options['seed'])
+            generate_addresses(options['addresses'], seed=options['seed'])
+        self.addresses = client_addresses(options['addresses'])
+        self.options = options
+        self.stats = LoadStats()
+        self.late_visits = 0
+        self.late_visits_lock = threading.Lock()
+
+        deadline = time.monotonic() + options['duration']
+        arrivals = queue.Queue() if options['rate'] else None
+        workers = [
+            threading.Thread(target=self.run_worker, args=(number, deadline, arrivals))
+            for number in range(options['concurrency'])
+        ]
+
+        started_at = time.monotonic()
+        for worker in workers:
+            worker.start()
+        if arrivals:
+            self.schedule_arrivals(arrivals, deadline, len(workers))
+        for worker in workers:
+            worker.join()
+        elapsed = time.monotonic() - started_at
+
+        report = {
+            'url': options['url'],
+            'concurrency': options['concurrency'],
+            'rate': options['rate'],
+            'duration_s': round(elapsed, 2),
+            'late_visits': self.late_visits,
+            'endpoints': self.stats.summarize(elapsed),
+        }
+        self.print_report(report)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as output:
+                json.dump(report, output, ensure_ascii=False, indent=2)
+
+    def schedule_arrivals(self, arrivals, deadline, workers_count):
+        """Start visits as a Poisson process at the requested rate."""
+        rng = random.Random(self.options['seed'])
+        next_arrival = time.monotonic()
+        while next_arrival < deadline:
+            time.sleep(max(next_arrival - time.monotonic(), 0))
+            arrivals.put(next_arrival)
+            next_arrival += rng.expovariate(self.options['rate'])
+        for _ in range(workers_count):
+            arrivals.put(None)
+
+    def run_worker(self, number, deadline, arrivals):
+        rng = random.Random(self.options['seed'] + number + 1)
+        with requests.Session() as session:
+            while arrivals or time.monotonic() < deadline:
+                if arrivals:
+                    arrival = arrivals.get()
+                    if arrival is None:
+                        return
+                    if time.monotonic() - arrival > LATE_VISIT_DELAY:
+                        with self.late_visits_lock:
+                            self.late_visits += 1
+                self.visit(session, rng)
+
+    def visit(self, session, rng):
+        self.request(session, 'GET', '/api/banners/')
+        products = self.request(session, 'GET', '/api/products/')
+        if not products or rng.random() >= self.options['order_ratio']:
+            return
+
+        self.request(session, 'POST', '/api/order/', json={
+            'products': random_cart(
+                [product['id'] for product in products], self.options['cart_size'], rng
+            ),
+            'firstname': 'Иван',
+            'lastname': 'Петров',
+            'phonenumber': '+79291234567',
+            'address': rng.choice(self.addresses),
+        }, headers={'Idempotency-Key': uuid.uuid4().hex})
+
+    def request(self, session, method, endpoint, **kwargs):
+        started_at = time.perf_counter()
+        try:
+            response = session.request(
+                method, f'{self.options["url"]}{endpoint}', timeout=30, **kwargs
+            )
+            ok = response.ok
+        except requests.RequestException:
+            response, ok = None, False
+        self.stats.record(endpoint, time.perf_counter() - started_at, ok)
+
+        if ok and method == 'GET':
+            return response.json()
+        return None
+
+    def print_report(self, report):
+        self.stdout.write(
+            f'{report["duration_s"]} с, потоков: {report["concurrency"]}, '
+            f'визитов в секунду: {report["rate"] or "без ограничения"}'
+        )
+        self.stdout.write(
+            f'{"адрес":<16} {"запросов":>9} {"в сек.":>8} {"ошибки":>8} '
+            f'{"p50, мс":>9} {"p95, мс":>9} {"p99, мс":>9}'
+        )
+        for endpoint, stats in report['endpoints'].items():
+            self.stdout.write(
+                f'{endpoint:<16} {stats["requests"]:>9} {stats["throughput_rps"]:>8} '
+                f'{stats["error_rate"]:>8.1%} {stats["p50_ms"]:>9} '
+                f'{stats["p95_ms"]:>9} {stats["p99_ms"]:>9}'
+            )
+        if report['late_visits']:
+            self.stdout.write(
+                f'Визитов, начатых позже чем через {LATE_VISIT_DELAY} с '
+                f'из-за нехватки потоков: {report["late_visits"]}'
+            )
@@ -0,0 +1,86 @@
+import re
+from collections import defaultdict
+
+import requests
+from django.core.management.base import BaseCommand, CommandError
+
+
+METRIC_LINE = re.compile(r'^(\w+)(?:\{(.*)\})? (\S+)$')
+LABEL = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+
+def parse_metrics(text):
+    for line in text.splitlines():
+        match = METRIC_LINE.match(line)
+        if not match:
+            continue
+        name, labels, value = match.groups()
+        yield name, dict(LABEL.findall(labels or '')), float(value)
+
+
+def estimate_quantile(buckets, quantile):
+    """Upper bound of the histogram bucket holding the quantile, in ms."""
+    buckets = sorted(buckets.items())
+    total = buckets[-1][1] if buckets else 0
+    for bound, count in buckets:
+        if count >= quantile * total:
+            return bound * 1000
+    return float('inf')
+
+
+class Command(BaseCommand):
+    help = 'Показывает время ответа и SQL-запросы по view из /metrics запущенного сервера'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--url', action='append',
+            help='Адрес /metrics, можно указать несколько раз, чтобы сложить метрики '
+                 'разных серверов. По умолчанию http://127.0.0.1:8000/metrics',
+        )
+
+    def handle(self, *args, **options):
+        metric_lines = []
+        for url in options['url'] or ['http://127.0.0.1:8000/metrics']:
+            try:
+                response = requests.get(url, timeout=10)
+                response.raise_for_status()
+            except requests.RequestException as error:
+                raise CommandError(f'Не удалось получить метрики {url}: {error}')
+            metric_lines.extend(parse_metrics(response.text))
+
+        stats = defaultdict(lambda: defaultdict(float))
+        buckets = defaultdict(lambda: defaultdict(float))
+        for name, labels, value in metric_lines:
+            if name.startswith('geocoder_'):
+                key = ('геокодер', labels.get('outcome'))
+            else:
+                key = (labels.get('view'), None)
+
+            if name.endswith('_bucket'):
+                bound = float('inf') if labels['le'] == '+Inf' else float(labels['le'])
+                buckets[key][bound] += value
+            elif name.endswith('_count'):
+                stats[key]['requests'] += value
+            elif name.endswith('_sum'):
+                stats[key]['seconds'] += value
+            elif name == 'db_queries_total':
+                stats[key]['queries'] += value
+            elif name == 'db_query_duration_seconds_total':
+                stats[key]['db_seconds'] += value
+
+        self.stdout.write(
+            f'{"view":<45} {"запросов":>9} {"сред., мс":>10} {"p95 ≤, мс":>10} '
+            f'{"SQL/запрос":>11} {"SQL, мс":>9}'
+        )
+        for (view, outcome), view_stats in sorted(stats.items(), key=lambda item: str(item[0])):
+            requests_count = view_stats['requests']
+            if not requests_count:
+                continue
+            title = f'{view}, {outcome}' if outcome else view
+            self.stdout.write(
+                f'{title:<45} {requests_count:>9.0f} '
+                f'{view_stats["seconds"] / requests_count * 1000:>10.1f} '
+                f'{estimate_quantile(buckets[(view, outcome)], 0.95):>10g} '
+                f'{view_stats["queries"] / requests_count:>11.1f} '
+                f'{view_stats["db_seconds"] / requests_count * 1000:>9.1f}'
+            )
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from foodcartapp.geocoder_stub import make_geocoder_stub
+
+
+class Command(BaseCommand):
+    help = 'Запускает локальную заглушку геокодера, которая выдаёт координаты любого адреса в Москве'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8001)
+        parser.add_argument(
+            '--delay', type=float, default=0,
+            help='Задержка ответа в секундах, чтобы изобразить медленный геокодер',
+        )
+
+    def handle(self, *args, **options):
+        server = make_geocoder_stub(options['host'], options['port'], options['delay'])
+        self.stdout.write(
+            f'Геокодер-заглушка: http://{options["host"]}:{server.server_port}/1.x'
+        )
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
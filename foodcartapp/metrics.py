@@ -0,0 +1,348 @@
+import atexit
+import json
+import os
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from threading import Lock
+
+from django.db import connection
+
+from star_burger.settings import METRICS_DIR
+
+try:
+    import fcntl
+except ImportError:  # Windows, where gunicorn does not run either
+    fcntl = None
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+METRICS_HELP = {
+    'http_request_duration_seconds': 'Время обработки запроса view',
+    'http_requests_total': 'Количество ответов по кодам',
+    'db_queries_total': 'Количество SQL-запросов',
+    'db_query_duration_seconds_total': 'Суммарное время SQL-запросов',
+    'geocoder_request_duration_seconds': 'Время запроса к геокодеру',
+    'geocoder_retries_total': 'Повторные запросы к геокодеру',
+    'geocoder_rejected_total': 'Запросы, не отправленные геокодеру из-за разомкнутого предохранителя',
+}
+
+
+class Histogram:
+    """Fixed buckets, so memory does not grow with the number of observations."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def merge(self, counts, total, count):
+        self.counts = [own + other for own, other in zip(self.counts, counts)]
+        self.sum += total
+        self.count += count
+
+    def cumulative_counts(self):
+        total = 0
+        for bound, count in zip([*self.buckets, '+Inf'], self.counts):
+            total += count
+            yield bound, total
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    escaped_labels = (
+        (name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in labels
+    )
+    return '{' + ','.join(f'{name}="{value}"' for name, value in escaped_labels) + '}'
+
+
+class MetricsRegistry:
+    """Counters and histograms of this process in Prometheus text format.
+
+    Label values have to come from a small fixed set, such as view names,
+    or memory stops being bounded.
+    """
+
+    def __init__(self):
+        self.counters = defaultdict(float)
+        self.histograms = {}
+        self._lock = Lock()
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] += value
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            if key not in self.histograms:
+                self.histograms[key] = Histogram()
+            self.histograms[key].observe(value)
+
+    def clear(self):
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'counters': [
+                    [name, labels, value]
+                    for (name, labels), value in self.counters.items()
+                ],
+                'histograms': [
+                    [name, labels, histogram.counts, histogram.sum, histogram.count]
+                    for (name, labels), histogram in self.histograms.items()
+                ],
+            }
+
+    def merge(self, snapshot):
+        with self._lock:
+            for name, labels, value in snapshot['counters']:
+                self.counters[(name, tuple(map(tuple, labels)))] += value
+            for name, labels, counts, total, count in snapshot['histograms']:
+                key = (name, tuple(map(tuple, labels)))
+                if key not in self.histograms:
+                    self.histograms[key] = Histogram()
+                self.histograms[key].merge(counts, total, count)
+
+    def render(self):
+        lines = []
+        with self._lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted(
+                (key, list(histogram.cumulative_counts()), histogram.sum, histogram.count)
+                for key, histogram in self.histograms.items()
+            )
+
+        described = set()
+
+        def describe(name, metric_type):
+            if name not in described:
+                described.add(name)
+                lines.append(f'# HELP {name} {METRICS_HELP.get(name, name)}')
+                lines.append(f'# TYPE {name} {metric_type}')
+
+        for (name, labels), value in counters:
+            describe(name, 'counter')
+            lines.append(f'{name}{format_labels(labels)} {value:g}')
+        for (name, labels), buckets, total, count in histograms:
+            describe(name, 'histogram')
+            for bound, bucket_count in buckets:
+                lines.append(
+                    f'{name}_bucket{format_labels([*labels, ("le", bound)])} {bucket_count}'
+                )
+            lines.append(f'{name}_sum{format_labels(labels)} {total:g}')
+            lines.append(f'{name}_count{format_labels(labels)} {count}')
+        return '\n'.join(lines) + '\n'
+
+
+def is_process_running(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass  # a process of another user
+    return True
+
+
+class MetricsStore:
+    """Registries of all processes, as one JSON file per process in `directory`.
+
+    Each process saves its registry at most every `interval` seconds,
+    and `/metrics` adds up all the files, so one scrape covers every
+    web server process and the geocode worker. Files of stopped
+    processes are folded into one archive file, so their counts stay
+    in the totals while the number of files stays bounded.
+    """
+
+    archive_name = 'archive.json'
+
+    def __init__(self, directory, interval=1):
+        self.directory = directory
+        self.interval = interval
+        self.pid = None
+        self.path = None
+        self.saved_at = 0
+        self._lock = Lock()
+
+    def save(self, registry, force=False):
+        if not self._lock.acquire(blocking=force):
+            return
+        try:
+            if not force and time.monotonic() < self.saved_at + self.interval:
+                return
+            snapshot = registry.snapshot()
+            if self.pid != os.getpid():
+                if not snapshot['counters'] and not snapshot['histograms']:
+                    return  # such as migrate or shell, which record nothing
+                # a forked process must not overwrite its parent's file
+                self.pid = os.getpid()
+                self.path = os.path.join(self.directory, f'{self.pid}-{time.time_ns()}.json')
+
+            os.makedirs(self.directory, exist_ok=True)
+            self.write_snapshot(self.path, snapshot)
+            self.saved_at = time.monotonic()
+        finally:
+            self._lock.release()
+
+    def write_snapshot(self, path, snapshot):
+        with open(f'{path}.tmp', 'w') as output:
+            json.dump(snapshot, output)
+        os.replace(f'{path}.tmp', path)
+
+    def read_snapshot(self, filename):
+        try:
+            with open(os.path.join(self.directory, filename)) as snapshot:
+                return json.load(snapshot)
+        except (OSError, ValueError):
+            return None
+
+    def remove(self, filename):
+        try:
+            os.remove(os.path.join(self.directory, filename))
+        except FileNotFoundError:
+            pass
+
+    def get_process_files(self):
+        """Return names of the process files, with the ids of their processes."""
+        process_files = []
+        for filename in os.listdir(self.directory):
+            pid, _, rest = filename.partition('-')
+            if pid.isdigit() and rest.endswith(('.json', '.json.tmp')):
+                process_files.append((filename, int(pid)))
+        return process_files
+
+    def archive_stopped_processes(self):
+        """Fold the files of processes that have exited into the archive file.
+
+        The archive lists the files it took in until the next run deletes
+        them, so a crash between writing the archive and deleting the
+        files does not count them twice.
+        """
+        archive = self.read_snapshot(self.archive_name) \
+            or {'counters': [], 'histograms': [], 'files': []}
+        for filename in archive['files']:
+            self.remove(filename)
+
+        stopped_files = [
+            filename for filename, pid in self.get_process_files()
+            if not is_process_running(pid)
+        ]
+        if not stopped_files:
+            return
+
+        registry = MetricsRegistry()
+        registry.merge(archive)
+        for filename in stopped_files:
+            snapshot = None if filename.endswith('.tmp') else self.read_snapshot(filename)
+            if snapshot:
+                registry.merge(snapshot)
+        self.write_snapshot(
+            os.path.join(self.directory, self.archive_name),
+            {**registry.snapshot(), 'files': stopped_files},
+        )
+        for filename in stopped_files:
+            self.remove(filename)
+
+    def load(self):
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, '.lock'), 'w') as lock:
+            if fcntl:
+                # one scrape at a time folds files into the archive
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                self.archive_stopped_processes()
+
+            archive = self.read_snapshot(self.archive_name)
+            registry = MetricsRegistry()
+            if archive:
+                registry.merge(archive)
+            archived_files = set(archive['files']) if archive else set()
+            for filename, pid in self.get_process_files():
+                if filename in archived_files or filename.endswith('.tmp'):
+                    continue
+                snapshot = self.read_snapshot(filename)
+                if snapshot:
+                    registry.merge(snapshot)
+        return registry
+
+
+metrics = MetricsRegistry()
+metrics_store = MetricsStore(METRICS_DIR) if METRICS_DIR else None
+
+
+def save_metrics(force=False):
+    if metrics_store:
+        metrics_store.save(metrics, force)
+
+
+def render_metrics():
+    """Metrics of all processes if METRICS_DIR is set, otherwise of this one."""
+    if not metrics_store:
+        return metrics.render()
+    save_metrics(force=True)
+    return metrics_store.load().render()
+
+
+atexit.register(save_metrics, force=True)
+
+
+class QueryStats:
+    def __init__(self):
+        self.count = 0
+        self.duration = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        started_at = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.duration += time.perf_counter() - started_at
+
+
+def get_view_name(request):
+    resolver_match = getattr(request, 'resolver_match', None)
+    if resolver_match is None:
+        return 'unmatched'
+    if resolver_match.url_name:
+        return resolver_match.view_name
+    return f'{resolver_match.func.__module__}.{resolver_match.func.__name__}'
+
+
+class MetricsMiddleware:
+    """Record latency and SQL queries of every request, labelled by view.
+
+    Queries run while a streaming response is being sent happen after
+    the middleware returns, so they are not counted.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        query_stats = QueryStats()
+        started_at = time.perf_counter()
+        with connection.execute_wrapper(query_stats):
+            response = self.get_response(request)
+        elapsed = time.perf_counter() - started_at
+
+        view = get_view_name(request)
+        metrics.observe('http_request_duration_seconds', elapsed, view=view)
+        metrics.inc('http_requests_total', view=view, status=response.status_code)
+        metrics.inc('db_queries_total', query_stats.count, view=view)
+        metrics.inc('db_query_duration_seconds_total', query_stats.duration, view=view)
+        save_metrics()
+        return response
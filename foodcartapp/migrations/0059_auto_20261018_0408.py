@@ -0,0 +1,33 @@
+# Generated by Django 3.0.7 on 2026-10-18 01:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodcartapp', '0058_auto_20210419_1500'),
+    ]
+
+    operations = [
+        migrations.RenameField(
+            model_name='order',
+            old_name='restaurants',
+            new_name='restaurant',
+        ),
+        migrations.AlterField(
+            model_name='mappoint',
+            name='lat',
+            field=models.FloatField(blank=True, null=True, verbose_name='Широта'),
+        ),
+        migrations.AlterField(
+            model_name='mappoint',
+            name='lon',
+            field=models.FloatField(blank=True, null=True, verbose_name='Долгота'),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='status',
+            field=models.CharField(choices=[('N', 'Наличными при доставке'), ('P', 'В работе'), ('C', 'Выполнен')], default='N', max_length=2, verbose_name='Статус'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 3.0.7 on 2026-10-18 01:09
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodcartapp', '0059_auto_20261018_0408'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GeocodeJob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('address', models.CharField(db_index=True, max_length=300, verbose_name='Адрес')),
+                ('created_time', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Задача создана')),
+                ('processed_time', models.DateTimeField(blank=True, db_index=True, null=True, verbose_name='Задача выполнена')),
+                ('attempts', models.IntegerField(default=0, verbose_name='Попыток')),
+                ('error', models.TextField(blank=True, verbose_name='Последняя ошибка')),
+            ],
+            options={
+                'verbose_name': 'Задача геокодирования',
+                'verbose_name_plural': 'Очередь геокодирования',
+            },
+        ),
+    ]
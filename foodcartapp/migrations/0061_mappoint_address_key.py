@@ -0,0 +1,37 @@
+from django.db import migrations, models
+
+from foodcartapp.geo_utils import normalize_address
+
+
+def fill_address_keys(apps, schema_editor):
+    MapPoint = apps.get_model('foodcartapp', 'MapPoint')
+    seen_keys = set()
+    for map_point in MapPoint.objects.order_by('-last_update').iterator():
+        address_key = normalize_address(map_point.address)
+        if address_key in seen_keys:
+            map_point.delete()
+            continue
+        seen_keys.add(address_key)
+        map_point.address_key = address_key
+        map_point.save(update_fields=['address_key'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodcartapp', '0060_geocodejob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mappoint',
+            name='address_key',
+            field=models.CharField(max_length=300, null=True, verbose_name='Нормализованный адрес'),
+        ),
+        migrations.RunPython(fill_address_keys, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='mappoint',
+            name='address_key',
+            field=models.CharField(max_length=300, unique=True, verbose_name='Нормализованный адрес'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 3.0.7 on 2026-10-18 01:15
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodcartapp', '0061_mappoint_address_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='candidates_updated_time',
+            field=models.DateTimeField(blank=True, db_index=True, null=True, verbose_name='Рестораны подобраны'),
+        ),
+        migrations.CreateModel(
+            name='OrderRestaurantCandidate',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('distance', models.FloatField(verbose_name='Расстояние, км')),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='restaurant_candidates', to='foodcartapp.Order', verbose_name='Заказ')),
+                ('restaurant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='order_candidates', to='foodcartapp.Restaurant', verbose_name='Ресторан')),
+            ],
+            options={
+                'verbose_name': 'Ресторан для заказа',
+                'verbose_name_plural': 'Рестораны для заказов',
+                'ordering': ['order', 'distance'],
+            },
+        ),
+    ]
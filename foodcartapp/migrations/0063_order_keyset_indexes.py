@@ -0,0 +1,26 @@
+# Generated by Django 3.0.7 on 2026-10-18 01:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodcartapp', '0062_orderrestaurantcandidate'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='order',
+            name='status',
+            field=models.CharField(choices=[('N', 'Необработанный'), ('P', 'В работе'), ('C', 'Выполнен')], default='N', max_length=2, verbose_name='Статус'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['status', 'created_time', 'id'], name='foodcartapp_status_7bfffb_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['created_time', 'id'], name='foodcartapp_created_7a183a_idx'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def fill_total_amount(apps, schema_editor):
+    Order = apps.get_model('foodcartapp', 'Order')
+    OrderPosition = apps.get_model('foodcartapp', 'OrderPosition')
+
+    subtotal = models.ExpressionWrapper(
+        models.F('current_price') * models.F('quantity'),
+        output_field=models.DecimalField()
+    )
+    order_total = OrderPosition.objects \
+        .filter(order=models.OuterRef('pk')) \
+        .values('order') \
+        .annotate(total=models.Sum(subtotal)) \
+        .values('total')
+    Order.objects.update(total_amount=Coalesce(
+        models.Subquery(order_total, output_field=models.DecimalField()),
+        0
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodcartapp', '0064_order_total_amount'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_total_amount, migrations.RunPython.noop),
+    ]
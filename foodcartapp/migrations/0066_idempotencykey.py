@@ -0,0 +1,30 @@
+# Generated by Django 3.0.7 on 2026-10-18 01:21
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodcartapp', '0065_fill_order_total_amount'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IdempotencyKey',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=255, unique=True, verbose_name='Ключ')),
+                ('request_hash', models.CharField(max_length=64, verbose_name='Хэш запроса')),
+                ('response_status', models.IntegerField(blank=True, null=True, verbose_name='Код ответа')),
+                ('response_body', models.TextField(blank=True, verbose_name='Тело ответа')),
+                ('created_time', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Создан')),
+                ('expires_time', models.DateTimeField(db_index=True, verbose_name='Истекает')),
+            ],
+            options={
+                'verbose_name': 'Ключ идемпотентности',
+                'verbose_name_plural': 'Ключи идемпотентности',
+            },
+        ),
+    ]
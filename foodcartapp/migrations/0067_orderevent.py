@@ -0,0 +1,27 @@
+# Generated by Django 3.0.7 on 2026-10-18 01:25
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodcartapp', '0066_idempotencykey'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderEvent',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('order_id', models.IntegerField(verbose_name='ID заказа')),
+                ('kind', models.CharField(choices=[('created', 'Создан'), ('updated', 'Изменён'), ('ranked', 'Подобраны рестораны'), ('deleted', 'Удалён')], max_length=10, verbose_name='Событие')),
+                ('created_time', models.DateTimeField(db_index=True, default=django.utils.timezone.now, verbose_name='Время события')),
+            ],
+            options={
+                'verbose_name': 'Событие заказа',
+                'verbose_name_plural': 'События заказов',
+            },
+        ),
+    ]
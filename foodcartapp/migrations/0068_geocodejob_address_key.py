@@ -0,0 +1,37 @@
+from django.db import migrations, models
+
+from foodcartapp.geo_utils import normalize_address
+
+
+def fill_address_keys(apps, schema_editor):
+    GeocodeJob = apps.get_model('foodcartapp', 'GeocodeJob')
+    for job in GeocodeJob.objects.iterator():
+        job.address_key = normalize_address(job.address)
+        job.save(update_fields=['address_key'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodcartapp', '0067_orderevent'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='geocodejob',
+            name='address_key',
+            field=models.CharField(default='', max_length=300, verbose_name='Нормализованный адрес'),
+            preserve_default=False,
+        ),
+        migrations.RunPython(fill_address_keys, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='geocodejob',
+            name='address_key',
+            field=models.CharField(db_index=True, max_length=300, verbose_name='Нормализованный адрес'),
+        ),
+        migrations.AlterField(
+            model_name='geocodejob',
+            name='address',
+            field=models.CharField(max_length=300, verbose_name='Адрес'),
+        ),
+    ]
@@ -1,6 +1,11 @@
-from geopy import distance
-
-from django.db import models
+import time
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db import models, transaction
+from django.db.models.functions import Coalesce
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 from django.core.validators import MinValueValidator
 from django.utils import timezone
 from django.utils.translation import gettext_lazy
@@ -8,8 +13,82 @@ from django.utils.translation import gettext_lazy
 from phonenumber_field.modelfields import PhoneNumberField
 
 from star_burger.settings import YANDEX_API_KEY
-
-from .geo_utils import fetch_coordinates
+from star_burger.settings import GEOCODER_BACKEND
+from star_burger.settings import GEOCODER_URL
+from star_burger.settings import GEOCODER_OFFLINE_FILE
+from star_burger.settings import GEOCODER_OFFLINE_FALLBACK
+from star_burger.settings import GEOCODER_WORKERS
+from star_burger.settings import GEOCODER_RATE_LIMIT
+from star_burger.settings import GEOCODER_CONNECT_TIMEOUT
+from star_burger.settings import GEOCODER_READ_TIMEOUT
+from star_burger.settings import GEOCODER_RETRIES
+from star_burger.settings import GEOCODER_CIRCUIT_FAILURES
+from star_burger.settings import GEOCODER_CIRCUIT_RESET
+from star_burger.settings import GEOCODE_CACHE_SIZE
+from star_burger.settings import GEOCODE_CACHE_TTL
+from star_burger.settings import GEOCODE_NEGATIVE_CACHE_TTL
+from star_burger.settings import DISTANCE_MODE
+from star_burger.settings import DELIVERY_RADIUS_KM
+from star_burger.settings import NEAREST_RESTAURANTS_COUNT
+from star_burger.settings import INDEX_CACHE_TTL
+
+from .availability import AvailabilityIndex
+from .distances import RestaurantIndex
+from .geo_utils import CircuitBreaker, GeocodeCache
+from .geo_utils import make_geocoder, normalize_address
+
+
+class ProcessIndex:
+    """An index kept in process memory, with its version in the shared cache.
+
+    `invalidate` bumps the version, and every process rebuilds its copy
+    once it sees another version. A copy is also rebuilt after `ttl`
+    seconds, in case the cache is not shared between processes.
+    """
+
+    def __init__(self, name, ttl):
+        self.version_key = f'{name}:version'
+        self.ttl = ttl
+        self.clear()
+
+    def get_version(self):
+        return cache.get(self.version_key, 0)
+
+    def get(self, version):
+        if self.value is not None and self.version == version \
+                and time.monotonic() < self.expires_at:
+            return self.value
+        return None
+
+    def set(self, value, version):
+        self.value = value
+        self.version = version
+        self.expires_at = time.monotonic() + self.ttl
+
+    def clear(self):
+        """Forget the copy of this process only."""
+        self.value = None
+        self.version = None
+        self.expires_at = 0
+
+    def invalidate(self):
+        cache.set(self.version_key, time.time_ns(), None)
+        self.clear()
+
+
+geocode_cache = GeocodeCache(GEOCODE_CACHE_SIZE)
+geocoder = make_geocoder(
+    GEOCODER_BACKEND,
+    YANDEX_API_KEY,
+    GEOCODER_URL,
+    offline_file=GEOCODER_OFFLINE_FILE,
+    offline_fallback=GEOCODER_OFFLINE_FALLBACK,
+    timeout=(GEOCODER_CONNECT_TIMEOUT, GEOCODER_READ_TIMEOUT),
+    retries=GEOCODER_RETRIES,
+    rate=GEOCODER_RATE_LIMIT,
+    workers=GEOCODER_WORKERS,
+    circuit_breaker=CircuitBreaker(GEOCODER_CIRCUIT_FAILURES, GEOCODER_CIRCUIT_RESET),
+)
 
 
 class Restaurant(models.Model):
@@ -105,75 +184,131 @@ class RestaurantMenuItem(models.Model):
         ]
 
 
+def get_order_total_expression():
+    subtotal = models.ExpressionWrapper(
+        models.F('current_price') * models.F('quantity'),
+        output_field=models.DecimalField()
+    )
+    order_total = OrderPosition.objects \
+        .filter(order=models.OuterRef('pk')) \
+        .values('order') \
+        .annotate(total=models.Sum(subtotal)) \
+        .values('total')
+    return Coalesce(
+        models.Subquery(order_total, output_field=models.DecimalField()),
+        0
+    )
+
+
 class OrderQuerySet(models.QuerySet):
     def total(self):
-        subtotal = models.ExpressionWrapper(
-            models.F('product_positions__current_price')
-            * models.F('product_positions__quantity'),
-            output_field=models.DecimalField()
-        )
-
-        return self.annotate(
-            total=models.Sum(subtotal)
-        )
+        return self.annotate(total=get_order_total_expression())
 
-    def fetch_restaurant_distance(self):
-        restaurants = Restaurant.objects.all()
+    def recalculate_total_amount(self):
+        return self.update(total_amount=get_order_total_expression())
 
-        known_points = {
-            address: (lon, lat) for address, lon, lat in
-            MapPoint.objects.values_list('address', 'lon', 'lat')
-        }
+    def with_positions(self):
+        positions = OrderPosition.objects \
+            .only('id', 'order_id', 'product_id', 'quantity', 'current_price')
+        return self.prefetch_related(
+            models.Prefetch('product_positions', queryset=positions)
+        )
 
-        restaurant_points = {
-            restaurant.id: known_points[restaurant.address]
-            if restaurant.address in known_points.keys()
-            else MapPoint.objects.save_point(restaurant.address)
-            for restaurant in restaurants
-        }
+    def for_manager_dashboard(self):
+        candidates = OrderRestaurantCandidate.objects.select_related('restaurant')
+        return self \
+            .with_positions() \
+            .prefetch_related(
+                models.Prefetch('restaurant_candidates', queryset=candidates)
+            )
 
-        menu_items = RestaurantMenuItem.objects \
-            .filter(availability=True) \
-            .order_by('product') \
-            .values_list('product', 'restaurant')
+    def fetch_restaurant_distance(self, enqueue_unknown=True):
+        restaurant_index, restaurants = get_restaurant_index()
 
-        product_restaurants = {
-            product: set() for product, restaurant in menu_items
-        }
+        order_addresses = [order.address for order in self]
+        known_points = MapPoint.objects.lookup_points(order_addresses)
+        if enqueue_unknown:
+            GeocodeJob.objects.enqueue_many(
+                address for address in order_addresses
+                if address not in known_points
+            )
 
-        for product, restaurant in menu_items:
-            product_restaurants[product].add(restaurant)
+        availability_index = get_availability_index()
 
         for order in self:
-            suitable_restaurants_ids = set.intersection(
-                *[product_restaurants[product.id] for product in order.products.all()]
+            order_point = known_points.get(order.address)
+            order.address_pending = order_point is None
+            order.address_found = is_point_known(order_point)
+            order.distances = []
+            if not order.address_found:
+                continue
+
+            suitable_restaurants_ids = availability_index.get_restaurant_ids(
+                position.product_id for position in order.product_positions.all()
             )
-
-            order_point = known_points[order.address] if order.address in known_points.keys() \
-                else MapPoint.objects.save_point(order.address)
-
-            distances = [
+            restaurant_ids, distances = restaurant_index.nearest(
+                order_point,
+                allowed_ids=suitable_restaurants_ids,
+                count=NEAREST_RESTAURANTS_COUNT,
+                radius_km=DELIVERY_RADIUS_KM,
+            )
+            order.distances = [
                 {
-                    'id': restaurant.id,
-                    'name': restaurant.name,
-                    'distance': distance.distance(
-                        order_point, restaurant_points[restaurant.id]
-                    ).km,
-                } for restaurant in restaurants
-                if restaurant.id in suitable_restaurants_ids
+                    'id': restaurant_id,
+                    'name': restaurants[restaurant_id].name,
+                    'distance': restaurant_distance,
+                } for restaurant_id, restaurant_distance in zip(restaurant_ids, distances)
             ]
 
-            order.distances = sorted(
-                distances,
-                key=lambda distance: distance['distance'],
+        return self
+
+    def stale_candidates(self):
+        return self.filter(candidates_updated_time__isnull=True)
+
+    def expire_candidates(self):
+        OrderRestaurantCandidate.objects.filter(order__in=self).delete()
+        return self.update(candidates_updated_time=None)
+
+    def unfinished(self):
+        return self.exclude(status=Order.Status.COMPLETE)
+
+    def older_than(self, created_time, order_id):
+        return self.filter(
+            models.Q(created_time__lt=created_time)
+            | models.Q(created_time=created_time, id__lt=order_id)
+        )
+
+    @transaction.atomic
+    def update_restaurant_candidates(self, enqueue_unknown=True):
+        orders = self.with_positions().fetch_restaurant_distance(enqueue_unknown)
+        resolved_orders = [order for order in orders if not order.address_pending]
+
+        OrderRestaurantCandidate.objects \
+            .filter(order__in=resolved_orders) \
+            .delete()
+        OrderRestaurantCandidate.objects.bulk_create([
+            OrderRestaurantCandidate(
+                order=order,
+                restaurant_id=candidate['id'],
+                distance=candidate['distance'],
             )
+            for order in resolved_orders
+            for candidate in order.distances
+        ])
+        self.model.objects \
+            .filter(id__in=[order.id for order in resolved_orders]) \
+            .update(candidates_updated_time=timezone.now())
+        OrderEvent.objects.bulk_create([
+            OrderEvent(order_id=order.id, kind=OrderEvent.Kind.RANKED)
+            for order in resolved_orders
+        ])
 
-        return self
+        return resolved_orders
 
 
 class Order(models.Model):
     class Status(models.TextChoices):
-        NEW = 'N', gettext_lazy('Наличными при доставке')
+        NEW = 'N', gettext_lazy('Необработанный')
         IN_PROGRESS = 'P', gettext_lazy('В работе')
         COMPLETE = 'C', gettext_lazy('Выполнен')
 
@@ -219,11 +354,29 @@ class Order(models.Model):
         null=True
     )
 
+    total_amount = models.DecimalField(
+        'Сумма заказа',
+        max_digits=10,
+        decimal_places=2,
+        default=0,
+        db_index=True
+    )
+    candidates_updated_time = models.DateTimeField(
+        'Рестораны подобраны',
+        null=True,
+        blank=True,
+        db_index=True
+    )
+
     objects = OrderQuerySet.as_manager()
 
     class Meta():
         verbose_name = 'Заказ'
         verbose_name_plural = 'Заказы'
+        indexes = [
+            models.Index(fields=['status', 'created_time', 'id']),
+            models.Index(fields=['created_time', 'id']),
+        ]
 
 
     def __str__(self):
@@ -268,30 +421,369 @@ class OrderPosition(models.Model):
         verbose_name_plural = 'Заказанные товары'
 
 
+def is_point_known(point):
+    if point is None:
+        return False
+    lon, lat = point
+    return lon is not None and lat is not None
+
+
+def is_point_fresh(point, last_update):
+    ttl = GEOCODE_CACHE_TTL if is_point_known(point) \
+        else GEOCODE_NEGATIVE_CACHE_TTL
+    return last_update >= timezone.now() - timedelta(seconds=ttl)
+
+
+class OrderRestaurantCandidate(models.Model):
+    order = models.ForeignKey(
+        Order,
+        on_delete=models.CASCADE,
+        related_name='restaurant_candidates',
+        verbose_name='Заказ'
+    )
+    restaurant = models.ForeignKey(
+        Restaurant,
+        on_delete=models.CASCADE,
+        related_name='order_candidates',
+        verbose_name='Ресторан'
+    )
+    distance = models.FloatField('Расстояние, км')
+
+    class Meta:
+        verbose_name = 'Ресторан для заказа'
+        verbose_name_plural = 'Рестораны для заказов'
+        ordering = ['order', 'distance']
+
+    def __str__(self):
+        return f'{self.order} - {self.restaurant}'
+
+
+class OrderEventQuerySet(models.QuerySet):
+    def after(self, event_id):
+        return self.filter(id__gt=event_id).order_by('id')
+
+    def last_id(self):
+        return self.aggregate(last_id=models.Max('id'))['last_id'] or 0
+
+    def older_than(self, created_time):
+        return self.filter(created_time__lt=created_time)
+
+
+class OrderEvent(models.Model):
+    class Kind(models.TextChoices):
+        CREATED = 'created', gettext_lazy('Создан')
+        UPDATED = 'updated', gettext_lazy('Изменён')
+        RANKED = 'ranked', gettext_lazy('Подобраны рестораны')
+        DELETED = 'deleted', gettext_lazy('Удалён')
+
+    # not a foreign key: events of deleted orders must stay in the log
+    order_id = models.IntegerField('ID заказа')
+    kind = models.CharField('Событие', max_length=10, choices=Kind.choices)
+    created_time = models.DateTimeField(
+        'Время события', default=timezone.now, db_index=True)
+
+    objects = OrderEventQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'Событие заказа'
+        verbose_name_plural = 'События заказов'
+
+    def __str__(self):
+        return f'{self.order_id} - {self.kind}'
+
+
+@receiver(post_save, sender=Order)
+def log_order_saved(sender, instance, created, **kwargs):
+    OrderEvent.objects.create(
+        order_id=instance.id,
+        kind=OrderEvent.Kind.CREATED if created else OrderEvent.Kind.UPDATED,
+    )
+
+
+@receiver(post_delete, sender=Order)
+def log_order_deleted(sender, instance, **kwargs):
+    OrderEvent.objects.create(order_id=instance.id, kind=OrderEvent.Kind.DELETED)
+
+
+@receiver(post_save, sender=OrderPosition)
+@receiver(post_delete, sender=OrderPosition)
+def log_order_position_changed(sender, instance, **kwargs):
+    if instance.order_id:
+        OrderEvent.objects.create(
+            order_id=instance.order_id, kind=OrderEvent.Kind.UPDATED
+        )
+
+
+@receiver(post_save, sender=RestaurantMenuItem)
+@receiver(post_delete, sender=RestaurantMenuItem)
+def expire_product_candidates(sender, instance, **kwargs):
+    Order.objects \
+        .unfinished() \
+        .filter(products=instance.product_id) \
+        .update(candidates_updated_time=None)
+
+
+_availability_index = ProcessIndex('availability_index', INDEX_CACHE_TTL)
+
+
+def get_availability_index():
+    version = _availability_index.get_version()
+    availability_index = _availability_index.get(version)
+    if availability_index is None:
+        availability_index = AvailabilityIndex(
+            RestaurantMenuItem.objects
+            .filter(availability=True)
+            .values_list('product', 'restaurant')
+        )
+        _availability_index.set(availability_index, version)
+    return availability_index
+
+
+@receiver(post_save, sender=RestaurantMenuItem)
+@receiver(post_delete, sender=RestaurantMenuItem)
+def invalidate_availability_index(sender, instance, **kwargs):
+    _availability_index.invalidate()
+
+
+@receiver(post_save, sender=Restaurant)
+def expire_restaurant_candidates(sender, instance, **kwargs):
+    Order.objects.unfinished().update(candidates_updated_time=None)
+
+
 class MapPointQuerySet(models.QuerySet):
-    def save_point(self, address):
-        current_address, created = self \
-            .update_or_create(
+    def lookup_point(self, address):
+        return self.lookup_points([address]).get(address)
+
+    def lookup_points(self, addresses, include_expired=True):
+        """Return the known `(lon, lat)` of addresses, by address.
+
+        Points older than their TTL are returned too, so orders and
+        restaurants keep their places while the geocoder is down, and
+        their addresses are queued to be geocoded again.
+        """
+        address_keys = {
+            address: normalize_address(address) for address in addresses
+        }
+
+        key_points = {}
+        missing_keys = set()
+        for address_key in set(address_keys.values()):
+            cached = geocode_cache.get(address_key)
+            if cached and is_point_fresh(*cached):
+                key_points[address_key], last_update = cached
+            else:
+                missing_keys.add(address_key)
+
+        expired_keys = set()
+        if missing_keys:
+            map_points = self \
+                .filter(address_key__in=missing_keys) \
+                .values_list('address_key', 'lon', 'lat', 'last_update')
+            for address_key, lon, lat, last_update in map_points:
+                geocode_cache.set(address_key, (lon, lat), last_update)
+                if not is_point_fresh((lon, lat), last_update):
+                    if not include_expired:
+                        continue
+                    expired_keys.add(address_key)
+                key_points[address_key] = (lon, lat)
+
+        if expired_keys:
+            GeocodeJob.objects.enqueue_many(
+                address for address, address_key in address_keys.items()
+                if address_key in expired_keys
+            )
+
+        return {
+            address: key_points[address_key]
+            for address, address_key in address_keys.items()
+            if address_key in key_points
+        }
+
+    def resolve_many(self, addresses):
+        addresses = set(addresses)
+        points = self.lookup_points(addresses, include_expired=False)
+
+        unknown_addresses = {}
+        for address in addresses - set(points):
+            unknown_addresses.setdefault(normalize_address(address), address)
+        if not unknown_addresses:
+            return points
+
+        fetched_coordinates = geocoder.fetch_many_coordinates(unknown_addresses.values())
+        now = timezone.now()
+        self.filter(address_key__in=[
+            normalize_address(address) for address in fetched_coordinates
+        ]).delete()
+        self.bulk_create([
+            MapPoint(
                 address=address,
-                defaults={
-                    'last_update': timezone.now,
-                    **fetch_coordinates(
-                        YANDEX_API_KEY, address
-                    )
-                }
+                address_key=normalize_address(address),
+                last_update=now,
+                **coordinates
             )
-        print(current_address)
-        return current_address.lon, current_address.lat
+            for address, coordinates in fetched_coordinates.items()
+        ], ignore_conflicts=True)
+
+        key_points = {}
+        for address, coordinates in fetched_coordinates.items():
+            address_key = normalize_address(address)
+            key_points[address_key] = (coordinates['lon'], coordinates['lat'])
+            geocode_cache.set(address_key, key_points[address_key], now)
+
+        for address in addresses - set(points):
+            address_key = normalize_address(address)
+            if address_key in key_points:
+                points[address] = key_points[address_key]
+        return points
 
 
 class MapPoint(models.Model):
     address = models.CharField('Адрес', max_length=300)
-    lon = models.FloatField('Долгота')
-    lat = models.FloatField('Широта')
+    address_key = models.CharField(
+        'Нормализованный адрес',
+        max_length=300,
+        unique=True
+    )
+    lon = models.FloatField('Долгота', null=True, blank=True)
+    lat = models.FloatField('Широта', null=True, blank=True)
     last_update = models.DateTimeField('Время обновления')
 
     objects = MapPointQuerySet.as_manager()
 
     def __str__(self):
         return f'{self.address}'
-    
+
+
+@receiver(post_save, sender=MapPoint)
+@receiver(post_delete, sender=MapPoint)
+def invalidate_cached_point(sender, instance, **kwargs):
+    geocode_cache.invalidate(instance.address_key)
+    invalidate_restaurant_index()
+
+
+@receiver(post_save, sender=Restaurant)
+@receiver(post_delete, sender=Restaurant)
+def invalidate_restaurant_points(sender, instance, **kwargs):
+    invalidate_restaurant_index()
+
+
+_restaurant_index = ProcessIndex('restaurant_index', INDEX_CACHE_TTL)
+
+
+def get_restaurant_index():
+    """Return the spatial index of located restaurants and those restaurants by id.
+
+    The index is kept in the process once every restaurant address
+    is geocoded, and is rebuilt when a restaurant or a point changes.
+    """
+    version = _restaurant_index.get_version()
+    cached_index = _restaurant_index.get(version)
+    if cached_index:
+        return cached_index
+
+    restaurants = list(Restaurant.objects.all())
+    addresses = [restaurant.address for restaurant in restaurants]
+    known_points = MapPoint.objects.lookup_points(addresses)
+    GeocodeJob.objects.enqueue_many(
+        address for address in addresses if address not in known_points
+    )
+
+    located_restaurants = {
+        restaurant.id: restaurant for restaurant in restaurants
+        if is_point_known(known_points.get(restaurant.address))
+    }
+    restaurant_index = RestaurantIndex(
+        list(located_restaurants),
+        [
+            known_points[restaurant.address]
+            for restaurant in located_restaurants.values()
+        ],
+        mode=DISTANCE_MODE,
+    )
+
+    if len(known_points) == len(set(addresses)):
+        _restaurant_index.set((restaurant_index, located_restaurants), version)
+    return restaurant_index, located_restaurants
+
+
+def invalidate_restaurant_index():
+    _restaurant_index.invalidate()
+
+
+def clear_process_indexes():
+    """Make this process rebuild both indexes from the DB on next use."""
+    _availability_index.clear()
+    _restaurant_index.clear()
+
+
+class GeocodeJobQuerySet(models.QuerySet):
+    def pending(self):
+        return self.filter(processed_time__isnull=True)
+
+    def enqueue(self, address):
+        address_key = normalize_address(address)
+        if not self.pending().filter(address_key=address_key).exists():
+            self.create(address=address, address_key=address_key)
+
+    def enqueue_many(self, addresses):
+        address_keys = {}
+        for address in addresses:
+            address_keys.setdefault(normalize_address(address), address)
+        if not address_keys:
+            return
+        queued_keys = set(
+            self.pending()
+            .filter(address_key__in=address_keys)
+            .values_list('address_key', flat=True)
+        )
+        self.bulk_create([
+            GeocodeJob(address=address, address_key=address_key)
+            for address_key, address in address_keys.items()
+            if address_key not in queued_keys
+        ])
+
+
+class GeocodeJob(models.Model):
+    address = models.CharField('Адрес', max_length=300)
+    address_key = models.CharField(
+        'Нормализованный адрес',
+        max_length=300,
+        db_index=True
+    )
+    created_time = models.DateTimeField('Задача создана', default=timezone.now)
+    processed_time = models.DateTimeField(
+        'Задача выполнена', null=True, blank=True, db_index=True)
+    attempts = models.IntegerField('Попыток', default=0)
+    error = models.TextField('Последняя ошибка', blank=True)
+
+    objects = GeocodeJobQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'Задача геокодирования'
+        verbose_name_plural = 'Очередь геокодирования'
+
+    def __str__(self):
+        return f'{self.address}'
+
+
+class IdempotencyKeyQuerySet(models.QuerySet):
+    def expired(self):
+        return self.filter(expires_time__lte=timezone.now())
+
+
+class IdempotencyKey(models.Model):
+    key = models.CharField('Ключ', max_length=255, unique=True)
+    request_hash = models.CharField('Хэш запроса', max_length=64)
+    response_status = models.IntegerField('Код ответа', null=True, blank=True)
+    response_body = models.TextField('Тело ответа', blank=True)
+    created_time = models.DateTimeField('Создан', default=timezone.now)
+    expires_time = models.DateTimeField('Истекает', db_index=True)
+
+    objects = IdempotencyKeyQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'Ключ идемпотентности'
+        verbose_name_plural = 'Ключи идемпотентности'
+
+    def __str__(self):
+        return f'{self.key}'
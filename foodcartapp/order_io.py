@@ -0,0 +1,177 @@
+import csv
+import json
+from datetime import datetime
+from decimal import Decimal
+from itertools import groupby
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, models, transaction
+from django.utils.dateparse import parse_datetime
+
+from .models import GeocodeJob, Order, OrderPosition, Product
+from .streaming import chunked
+
+
+ORDER_FIELDS = [
+    'firstname',
+    'lastname',
+    'phonenumber',
+    'address',
+    'status',
+    'payment_method',
+    'comment',
+    'created_time',
+    'called_time',
+    'delivered_time',
+    'total_amount',
+]
+DATETIME_FIELDS = ['created_time', 'called_time', 'delivered_time']
+POSITION_FIELDS = ['product', 'quantity', 'current_price']
+CSV_FIELDS = ['id', *ORDER_FIELDS, *POSITION_FIELDS]
+
+
+def get_format(path, file_format):
+    if file_format:
+        return file_format
+    return 'csv' if path.endswith('.csv') else 'jsonl'
+
+
+def iterate_orders(orders, chunk_size):
+    """Yield exported orders with their positions, one chunk at a time."""
+    order_values = orders \
+        .order_by('id') \
+        .values('id', *ORDER_FIELDS) \
+        .iterator(chunk_size=chunk_size)
+
+    for orders_chunk in chunked(order_values, chunk_size):
+        positions = OrderPosition.objects \
+            .filter(order_id__in=[order['id'] for order in orders_chunk]) \
+            .order_by('order_id', 'id') \
+            .values('order_id', *POSITION_FIELDS)
+
+        order_positions = {
+            order_id: list(positions)
+            for order_id, positions in groupby(positions, lambda position: position['order_id'])
+        }
+        for order in orders_chunk:
+            order['phonenumber'] = str(order['phonenumber'])
+            order['products'] = [
+                {field: position[field] for field in POSITION_FIELDS}
+                for position in order_positions.get(order['id'], [])
+            ]
+            yield order
+
+
+class OrderEncoder(DjangoJSONEncoder):
+    def default(self, o):
+        if isinstance(o, datetime):
+            # DjangoJSONEncoder cuts microseconds, and the orders page sorts by them
+            return o.isoformat()
+        return super().default(o)
+
+
+def write_jsonl(orders, output):
+    for order in orders:
+        output.write(json.dumps(order, cls=OrderEncoder, ensure_ascii=False))
+        output.write('\n')
+
+
+def write_csv(orders, output):
+    writer = csv.DictWriter(output, fieldnames=CSV_FIELDS)
+    writer.writeheader()
+    for order in orders:
+        positions = order.pop('products') or [{}]
+        for position in positions:
+            writer.writerow({**order, **position})
+
+
+def read_jsonl(lines):
+    for line in lines:
+        if line.strip():
+            yield json.loads(line)
+
+
+def read_csv(lines):
+    rows = csv.DictReader(lines)
+    for order_id, order_rows in groupby(rows, lambda row: row['id']):
+        order_rows = list(order_rows)
+        order = {field: order_rows[0].get(field, '') for field in ['id', *ORDER_FIELDS]}
+        order['products'] = [
+            {field: row[field] for field in POSITION_FIELDS}
+            for row in order_rows if row.get('product')
+        ]
+        yield order
+
+
+WRITERS = {'jsonl': write_jsonl, 'csv': write_csv}
+READERS = {'jsonl': read_jsonl, 'csv': read_csv}
+
+
+def build_order(raw_order, prices):
+    order = Order(**{
+        field: raw_order[field] for field in ORDER_FIELDS
+        if raw_order.get(field) not in (None, '') and field not in DATETIME_FIELDS
+    })
+    for field in DATETIME_FIELDS:
+        if raw_order.get(field):
+            setattr(order, field, parse_datetime(raw_order[field]))
+
+    positions = []
+    for raw_position in raw_order['products']:
+        product_id = int(raw_position['product'])
+        if product_id not in prices:
+            raise ValueError(f'неизвестный товар {product_id}')
+        current_price = raw_position.get('current_price')
+        positions.append(OrderPosition(
+            product_id=product_id,
+            quantity=int(raw_position.get('quantity') or 1),
+            current_price=Decimal(str(current_price)) if current_price not in (None, '')
+            else prices[product_id],
+        ))
+
+    order.total_amount = sum(
+        position.current_price * position.quantity for position in positions
+    )
+    return order, positions
+
+
+def get_locked_last_order_id():
+    """Return the largest order id and make concurrent inserts wait for this transaction."""
+    if connection.vendor == 'sqlite':
+        # a SELECT takes only a shared lock, while any write takes the database lock
+        Order.objects.filter(id__lt=0).update(status=models.F('status'))
+    last_ids = Order.objects \
+        .select_for_update() \
+        .order_by('-id') \
+        .values_list('id', flat=True)[:1]
+    return next(iter(last_ids), 0)
+
+
+@transaction.atomic
+def save_orders(orders_with_positions):
+    orders = [order for order, positions in orders_with_positions]
+    if not connection.features.can_return_rows_from_bulk_insert:
+        # the backend won't report new ids, so hand them out ourselves
+        # while no one else can insert orders
+        last_id = get_locked_last_order_id()
+        for order_id, order in enumerate(orders, start=last_id + 1):
+            order.id = order_id
+    Order.objects.bulk_create(orders)
+
+    positions = []
+    for order, order_positions in orders_with_positions:
+        for position in order_positions:
+            position.order_id = order.id
+            positions.append(position)
+    OrderPosition.objects.bulk_create(positions)
+    GeocodeJob.objects.enqueue_many(order.address for order in orders)
+
+
+def import_orders(raw_orders, batch_size):
+    """Save orders in batches and return how many were imported."""
+    prices = dict(Product.objects.values_list('id', 'price'))
+    imported = 0
+    for raw_orders_batch in chunked(raw_orders, batch_size):
+        save_orders([build_order(raw_order, prices) for raw_order in raw_orders_batch])
+        imported += len(raw_orders_batch)
+    return imported
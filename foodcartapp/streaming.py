@@ -0,0 +1,40 @@
+from itertools import islice
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+
+
+STREAM_BUFFER_SIZE = 64 * 1024
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def iter_json_array(items):
+    """Encode items as a JSON array piece by piece, in ~64 KB chunks."""
+    encoder = DjangoJSONEncoder(ensure_ascii=False, separators=(',', ':'))
+    buffer = ['[']
+    buffer_size = 1
+    for index, item in enumerate(items):
+        encoded_item = encoder.encode(item)
+        if index:
+            buffer.append(',')
+        buffer.append(encoded_item)
+        buffer_size += len(encoded_item) + 1
+        if buffer_size >= STREAM_BUFFER_SIZE:
+            yield ''.join(buffer).encode()
+            buffer, buffer_size = [], 0
+    buffer.append(']')
+    yield ''.join(buffer).encode()
+
+
+class StreamingJsonResponse(StreamingHttpResponse):
+    def __init__(self, items, **kwargs):
+        kwargs.setdefault('content_type', 'application/json')
+        super().__init__(iter_json_array(items), **kwargs)
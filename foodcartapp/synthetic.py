@@ -0,0 +1,154 @@
+"""Synthetic restaurants, menus and orders for benchmarks and load tests.
+
+Every address gets a pre-seeded MapPoint, so nothing here needs the geocoder.
+"""
+import random
+
+from django.utils import timezone
+
+from .catalogue import bump_catalogue_version
+from .geo_utils import normalize_address
+from .models import MapPoint, Order, OrderPosition, Product, ProductCategory
+from .models import Restaurant, RestaurantMenuItem, geocode_cache
+from .models import invalidate_availability_index, invalidate_restaurant_index
+from .order_io import save_orders
+
+
+MOSCOW_LON, MOSCOW_LAT = 37.62, 55.75
+
+
+def clustered_points(count, clusters, rng, spread=0.02):
+    """Points around `clusters` random centres, like addresses in busy districts."""
+    centers = [
+        (MOSCOW_LON + rng.uniform(-0.3, 0.3), MOSCOW_LAT + rng.uniform(-0.2, 0.2))
+        for _ in range(max(clusters, 1))
+    ]
+    points = []
+    for _ in range(count):
+        center_lon, center_lat = rng.choice(centers)
+        points.append((
+            round(center_lon + rng.gauss(0, spread), 6),
+            round(center_lat + rng.gauss(0, spread), 6),
+        ))
+    return points
+
+
+def seed_map_points(address_points):
+    now = timezone.now()
+    MapPoint.objects.bulk_create([
+        MapPoint(
+            address=address,
+            address_key=normalize_address(address),
+            lon=lon,
+            lat=lat,
+            last_update=now,
+        )
+        for address, (lon, lat) in address_points.items()
+    ], ignore_conflicts=True)
+
+
+def reset_process_caches():
+    # bulk_create does not send the signals that normally expire these
+    invalidate_restaurant_index()
+    invalidate_availability_index(sender=RestaurantMenuItem, instance=None)
+    geocode_cache.clear()
+    bump_catalogue_version()
+
+
+def create_catalogue(restaurants_count, products_count, menu_density=0.6,
+                     clusters=5, seed=0):
+    """Create restaurants with located addresses and a random menu for each.
+
+    Returns the ids of the new restaurants and products.
+    """
+    rng = random.Random(seed)
+    category = ProductCategory.objects.create(name='Синтетические товары')
+
+    restaurant_addresses = [
+        f'Москва, синтетическая улица, {number}' for number in range(restaurants_count)
+    ]
+    Restaurant.objects.bulk_create([
+        Restaurant(name=f'Star Burger №{number}', address=address)
+        for number, address in enumerate(restaurant_addresses)
+    ])
+    restaurant_ids = list(
+        Restaurant.objects
+        .filter(address__in=restaurant_addresses)
+        .values_list('id', flat=True)
+    )
+    seed_map_points(dict(zip(
+        restaurant_addresses,
+        clustered_points(restaurants_count, clusters, rng, spread=0.05),
+    )))
+
+    Product.objects.bulk_create([
+        Product(
+            name=f'Бургер №{number}',
+            category=category,
+            price=rng.randint(100, 600),
+            image='burger.jpg',
+        )
+        for number in range(products_count)
+    ])
+    product_ids = list(category.products.values_list('id', flat=True))
+
+    RestaurantMenuItem.objects.bulk_create([
+        RestaurantMenuItem(restaurant_id=restaurant_id, product_id=product_id)
+        for restaurant_id in restaurant_ids
+        for product_id in product_ids
+        if rng.random() < menu_density
+    ])
+
+    reset_process_caches()
+    return restaurant_ids, product_ids
+
+
+def client_addresses(count):
+    return [f'Москва, улица Клиентов, {number}' for number in range(count)]
+
+
+def generate_addresses(count, clusters=5, seed=0):
+    """Client addresses with their coordinates; the MapPoints are seeded too."""
+    rng = random.Random(seed)
+    address_points = dict(zip(
+        client_addresses(count),
+        clustered_points(count, clusters, rng),
+    ))
+    seed_map_points(address_points)
+    return list(address_points)
+
+
+def random_cart(product_ids, cart_size, rng):
+    return [
+        {'product': product_id, 'quantity': rng.randint(1, 3)}
+        for product_id in rng.sample(product_ids, min(cart_size, len(product_ids)))
+    ]
+
+
+def create_orders(orders_count, product_ids, addresses, cart_size=3, seed=0,
+                  batch_size=1000):
+    rng = random.Random(seed)
+    prices = dict(Product.objects.filter(id__in=product_ids).values_list('id', 'price'))
+
+    for batch_start in range(0, orders_count, batch_size):
+        orders_with_positions = []
+        for _ in range(min(batch_size, orders_count - batch_start)):
+            positions = [
+                OrderPosition(
+                    product_id=item['product'],
+                    quantity=item['quantity'],
+                    current_price=prices[item['product']],
+                )
+                for item in random_cart(product_ids, cart_size, rng)
+            ]
+            order = Order(
+                firstname='Иван',
+                lastname='Петров',
+                phonenumber='+79291234567',
+                address=rng.choice(addresses),
+                total_amount=sum(
+                    position.current_price * position.quantity for position in positions
+                ),
+            )
+            orders_with_positions.append((order, positions))
+        save_orders(orders_with_positions)
@@ -0,0 +1,826 @@
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+import numpy as np
+import requests
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from .distances import RestaurantIndex, haversine_matrix
+from .geo_utils import CircuitBreaker, GeocoderClient, GeocoderResponseError
+from .geo_utils import GeocoderUnavailable
+from .geo_utils import OfflineGeocoder, RetryBudget, hash_coordinates, normalize_address
+from .geocoder_stub import make_geocoder_stub
+from .metrics import MetricsRegistry, MetricsStore, metrics
+from .models import GeocodeJob, MapPoint, Order, OrderPosition, Product, Restaurant
+from .models import RestaurantMenuItem
+from .models import geocode_cache, get_availability_index
+
+
+STUB_PLACES = {
+    'москва, тверская 1': (37.611, 55.757),
+    'москва, арбат 10': (37.596, 55.751),
+    'нигде': None,
+}
+
+
+class GeocoderStubTestCase(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = make_geocoder_stub(places=STUB_PLACES, record_requests=True)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.geocoder_url = f'http://127.0.0.1:{cls.server.server_port}/1.x'
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        self.server.requested_places.clear()
+        self.server.failures.clear()
+        self.server.delay = 0
+        geocode_cache.clear()
+        patcher = mock.patch(
+            'foodcartapp.models.geocoder',
+            GeocoderClient('key', self.geocoder_url, backoff=0),
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+
+class ResolveManyTest(GeocoderStubTestCase):
+    def test_resolves_unknown_addresses_once(self):
+        addresses = [
+            'Москва, Тверская 1',
+            'Москва, Арбат 10',
+            'Москва, Тверская 1',
+            'Нигде',
+        ]
+
+        points = MapPoint.objects.resolve_many(addresses)
+
+        self.assertEqual(points['Москва, Тверская 1'], (37.611, 55.757))
+        self.assertEqual(points['Москва, Арбат 10'], (37.596, 55.751))
+        self.assertEqual(points['Нигде'], (None, None))
+        self.assertCountEqual(
+            self.server.requested_places,
+            ['Москва, Тверская 1', 'Москва, Арбат 10', 'Нигде'],
+        )
+        self.assertEqual(MapPoint.objects.count(), 3)
+
+    def test_skips_known_points(self):
+        MapPoint.objects.resolve_many(['Москва, Тверская 1'])
+        geocode_cache.clear()
+        self.server.requested_places.clear()
+
+        MapPoint.objects.resolve_many(['Москва, Тверская 1', 'Москва, Арбат 10'])
+
+        self.assertEqual(self.server.requested_places, ['Москва, Арбат 10'])
+        self.assertEqual(MapPoint.objects.count(), 2)
+
+    def test_address_variants_share_one_point(self):
+        points = MapPoint.objects.resolve_many([
+            'Москва, Тверская 1',
+            'москва,  тверская 1 ',
+        ])
+
+        self.assertEqual(len(self.server.requested_places), 1)
+        self.assertEqual(points['Москва, Тверская 1'], (37.611, 55.757))
+        self.assertEqual(points['москва,  тверская 1 '], (37.611, 55.757))
+        self.assertEqual(MapPoint.objects.count(), 1)
+
+
+class GeocodeWorkerTest(GeocoderStubTestCase):
+    def run_worker(self):
+        call_command('geocode_worker', '--once', '--max-attempts', '2', stdout=StringIO())
+
+    def test_geocodes_queued_addresses(self):
+        GeocodeJob.objects.enqueue('Москва, Тверская 1')
+
+        self.run_worker()
+
+        self.assertFalse(GeocodeJob.objects.pending().exists())
+        self.assertEqual(
+            MapPoint.objects.lookup_point('Москва, Тверская 1'), (37.611, 55.757)
+        )
+
+    def test_keeps_address_as_written(self):
+        GeocodeJob.objects.enqueue_many(['Москва, Тверская 1', 'москва,  тверская 1 '])
+        GeocodeJob.objects.enqueue('МОСКВА, ТВЕРСКАЯ 1')
+        self.assertEqual(GeocodeJob.objects.get().address, 'Москва, Тверская 1')
+
+        self.run_worker()
+
+        self.assertEqual(self.server.requested_places, ['Москва, Тверская 1'])
+        self.assertEqual(MapPoint.objects.get().address, 'Москва, Тверская 1')
+
+    def test_refreshes_expired_points(self):
+        MapPoint.objects.create(
+            address='Москва, Тверская 1',
+            address_key=normalize_address('Москва, Тверская 1'),
+            lon=37.0,
+            lat=55.0,
+            last_update=timezone.now() - timedelta(days=31),
+        )
+        self.server.failures.append(503)
+        MapPoint.objects.lookup_point('Москва, Тверская 1')
+
+        with mock.patch('foodcartapp.models.geocoder.retries', 0):
+            self.run_worker()
+        self.assertEqual(MapPoint.objects.lookup_point('Москва, Тверская 1'), (37.0, 55.0))
+        self.run_worker()
+
+        self.assertFalse(GeocodeJob.objects.pending().exists())
+        self.assertEqual(
+            MapPoint.objects.lookup_point('Москва, Тверская 1'), (37.611, 55.757)
+        )
+
+    def test_ranks_only_unfinished_orders(self):
+        orders = [
+            Order.objects.create(
+                firstname='Иван',
+                lastname='Петров',
+                phonenumber='+79291234567',
+                address=address,
+                status=status,
+            )
+            for address, status in [
+                ('Москва, Тверская 1', Order.Status.NEW),
+                ('Москва, Арбат 10', Order.Status.COMPLETE),
+            ]
+        ]
+        GeocodeJob.objects.enqueue('Москва, Тверская 1')
+
+        self.run_worker()
+
+        new_order, complete_order = Order.objects.filter(id__in=[order.id for order in orders]) \
+            .order_by('id')
+        self.assertIsNotNone(new_order.candidates_updated_time)
+        self.assertIsNone(complete_order.candidates_updated_time)
+        self.assertFalse(GeocodeJob.objects.filter(address_key='москва, арбат 10').exists())
+
+    def test_ranks_orders_expired_by_menu_changes(self):
+        restaurant = Restaurant.objects.create(name='Бургерная', address='Москва, Арбат 10')
+        product = Product.objects.create(name='Бургер', price=100, image='burger.jpg')
+        menu_item = RestaurantMenuItem.objects.create(restaurant=restaurant, product=product)
+        order = Order.objects.create(
+            firstname='Иван',
+            lastname='Петров',
+            phonenumber='+79291234567',
+            address='Москва, Тверская 1',
+        )
+        OrderPosition.objects.create(order=order, product=product, current_price=100)
+        MapPoint.objects.resolve_many(['Москва, Тверская 1', 'Москва, Арбат 10'])
+        Order.objects.update_restaurant_candidates()
+
+        menu_item.availability = False
+        menu_item.save()
+        self.assertTrue(Order.objects.stale_candidates().exists())
+
+        self.run_worker()
+
+        order.refresh_from_db()
+        self.assertIsNotNone(order.candidates_updated_time)
+        self.assertFalse(order.restaurant_candidates.exists())
+
+    def test_exhausted_address_is_not_queued_again(self):
+        self.server.failures.extend([403, 403])
+        Order.objects.create(
+            firstname='Иван',
+            lastname='Петров',
+            phonenumber='+79291234567',
+            address='Москва, Тверская 1',
+        )
+        GeocodeJob.objects.enqueue('Москва, Тверская 1')
+
+        self.run_worker()
+        self.run_worker()
+
+        self.assertEqual(GeocodeJob.objects.count(), 1)
+        self.assertFalse(GeocodeJob.objects.pending().exists())
+
+    def test_exhausted_job_is_closed(self):
+        self.server.failures.extend([403, 403])
+        GeocodeJob.objects.enqueue('Москва, Тверская 1')
+
+        self.run_worker()
+        self.assertTrue(GeocodeJob.objects.pending().exists())
+        self.run_worker()
+
+        job = GeocodeJob.objects.get()
+        self.assertEqual(job.attempts, 2)
+        self.assertIsNotNone(job.processed_time)
+        self.assertTrue(job.error)
+
+        GeocodeJob.objects.enqueue('Москва, Тверская 1')
+        self.assertEqual(GeocodeJob.objects.pending().count(), 1)
+
+
+class LookupPointsTest(TestCase):
+    def setUp(self):
+        geocode_cache.clear()
+
+    def create_point(self, address, lon, lat, age):
+        MapPoint.objects.create(
+            address=address,
+            address_key=normalize_address(address),
+            lon=lon,
+            lat=lat,
+            last_update=timezone.now() - age,
+        )
+
+    def test_remembers_addresses_not_found(self):
+        self.create_point('Нигде', None, None, timedelta(hours=1))
+
+        self.assertEqual(MapPoint.objects.lookup_points(['Нигде']), {'Нигде': (None, None)})
+
+    def test_negative_results_expire_sooner(self):
+        self.create_point('Москва, Тверская 1', 37.611, 55.757, timedelta(days=2))
+        self.create_point('Нигде', None, None, timedelta(days=2))
+
+        self.assertEqual(
+            MapPoint.objects.lookup_points(
+                ['Москва, Тверская 1', 'Нигде'], include_expired=False
+            ),
+            {'Москва, Тверская 1': (37.611, 55.757)},
+        )
+
+    def test_expired_points_are_returned_and_queued(self):
+        self.create_point('Москва, Тверская 1', 37.611, 55.757, timedelta(days=31))
+
+        self.assertEqual(
+            MapPoint.objects.lookup_points(['Москва, Тверская 1']),
+            {'Москва, Тверская 1': (37.611, 55.757)},
+        )
+        self.assertEqual(GeocodeJob.objects.pending().get().address, 'Москва, Тверская 1')
+        self.assertEqual(
+            MapPoint.objects.lookup_points(['Москва, Тверская 1'], include_expired=False),
+            {},
+        )
+
+    def test_expired_cache_entry_is_not_used(self):
+        geocode_cache.set(
+            normalize_address('Москва, Тверская 1'),
+            (37.0, 55.0),
+            timezone.now() - timedelta(days=31),
+        )
+        self.assertEqual(
+            MapPoint.objects.lookup_points(['Москва, Тверская 1'], include_expired=False),
+            {},
+        )
+
+        self.create_point('Москва, Тверская 1', 37.611, 55.757, timedelta(hours=1))
+        with self.assertNumQueries(1):
+            MapPoint.objects.lookup_points(['Москва, Тверская 1'])
+        with self.assertNumQueries(0):
+            points = MapPoint.objects.lookup_points(['Москва, Тверская 1'])
+        self.assertEqual(points, {'Москва, Тверская 1': (37.611, 55.757)})
+
+
+class GeocoderClientTest(GeocoderStubTestCase):
+    def get_client(self, **kwargs):
+        kwargs.setdefault('backoff', 0)
+        kwargs.setdefault('rate', None)
+        return GeocoderClient('key', self.geocoder_url, **kwargs)
+
+    def test_retries_server_errors(self):
+        self.server.failures.extend([503, 500])
+
+        coordinates = self.get_client(retries=2).fetch_coordinates('Москва, Арбат 10')
+
+        self.assertEqual(coordinates, {'lon': 37.596, 'lat': 55.751})
+        self.assertEqual(len(self.server.requested_places), 3)
+
+    def test_does_not_retry_client_errors(self):
+        self.server.failures.append(403)
+
+        with self.assertRaises(requests.HTTPError):
+            self.get_client(retries=2).fetch_coordinates('Москва, Арбат 10')
+        self.assertEqual(len(self.server.requested_places), 1)
+
+    def test_slow_response_times_out(self):
+        self.server.delay = 0.5
+
+        started_at = time.monotonic()
+        with self.assertRaises(requests.Timeout):
+            self.get_client(timeout=(1, 0.1), retries=0).fetch_coordinates('Москва, Арбат 10')
+        self.assertLess(time.monotonic() - started_at, 0.4)
+
+    def test_retry_budget_limits_retries(self):
+        self.server.failures.extend([500] * 5)
+        client = self.get_client(retries=3, retry_budget=RetryBudget(ratio=0, max_tokens=1))
+
+        with self.assertRaises(requests.HTTPError):
+            client.fetch_coordinates('Москва, Арбат 10')
+        self.assertEqual(len(self.server.requested_places), 2)
+
+    def test_open_circuit_fails_fast(self):
+        self.server.failures.extend([500] * 5)
+        client = self.get_client(
+            retries=0, circuit_breaker=CircuitBreaker(failure_threshold=2, reset_timeout=60)
+        )
+
+        for _ in range(2):
+            with self.assertRaises(requests.HTTPError):
+                client.fetch_coordinates('Москва, Арбат 10')
+        with self.assertRaises(GeocoderUnavailable):
+            client.fetch_coordinates('Москва, Арбат 10')
+
+        self.assertEqual(len(self.server.requested_places), 2)
+        self.assertEqual(client.fetch_many_coordinates(['Москва, Арбат 10']), {})
+
+    def test_unexpected_body_fails_trial_call(self):
+        self.server.failures.extend([500, (200, b'<html>Service unavailable</html>')])
+        client = self.get_client(
+            retries=0, circuit_breaker=CircuitBreaker(failure_threshold=1, reset_timeout=0)
+        )
+
+        with self.assertRaises(requests.HTTPError):
+            client.fetch_coordinates('Москва, Арбат 10')
+        self.assertEqual(client.fetch_many_coordinates(['Москва, Арбат 10']), {})
+
+        self.assertEqual(
+            client.fetch_coordinates('Москва, Арбат 10'), {'lon': 37.596, 'lat': 55.751}
+        )
+
+    def test_unexpected_json_is_a_response_error(self):
+        self.server.failures.append((200, b'{"response": {}}'))
+
+        with self.assertRaises(GeocoderResponseError):
+            self.get_client(retries=2).fetch_coordinates('Москва, Арбат 10')
+        self.assertEqual(len(self.server.requested_places), 1)
+
+    def test_circuit_closes_after_successful_trial(self):
+        self.server.failures.append(500)
+        client = self.get_client(
+            retries=0, circuit_breaker=CircuitBreaker(failure_threshold=1, reset_timeout=0)
+        )
+
+        with self.assertRaises(requests.HTTPError):
+            client.fetch_coordinates('Москва, Арбат 10')
+        self.assertEqual(
+            client.fetch_coordinates('Москва, Арбат 10'), {'lon': 37.596, 'lat': 55.751}
+        )
+        self.assertIsNone(client.circuit_breaker.opened_at)
+
+
+class OfflineGeocoderTest(TestCase):
+    def setUp(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as table:
+            table.write('address,lon,lat\n"Москва, Тверская 1",37.611,55.757\n')
+        self.addCleanup(os.remove, table.name)
+        self.table_path = table.name
+
+    def test_reads_points_from_table(self):
+        geocoder = OfflineGeocoder(self.table_path)
+        self.assertEqual(
+            geocoder.fetch_coordinates('москва,  тверская 1'), {'lon': 37.611, 'lat': 55.757}
+        )
+
+    def test_unknown_address_gets_stable_coordinates(self):
+        lon, lat = hash_coordinates('Москва, Арбат 10')
+        self.assertEqual(
+            OfflineGeocoder(self.table_path).fetch_many_coordinates(['Москва, Арбат 10']),
+            {'Москва, Арбат 10': {'lon': lon, 'lat': lat}},
+        )
+        self.assertEqual(
+            OfflineGeocoder(self.table_path, fallback=False).fetch_coordinates('Москва, Арбат 10'),
+            {'lon': None, 'lat': None},
+        )
+
+    def test_resolves_addresses_without_network(self):
+        with mock.patch('foodcartapp.models.geocoder', OfflineGeocoder(self.table_path)):
+            points = MapPoint.objects.resolve_many(['Москва, Тверская 1'])
+        self.assertEqual(points['Москва, Тверская 1'], (37.611, 55.757))
+
+
+class RestaurantIndexTest(SimpleTestCase):
+    def brute_force_nearest(self, point, restaurant_ids, points, count=None, radius_km=None):
+        distances = haversine_matrix(point, points)[0]
+        nearest = sorted(zip(distances, restaurant_ids))
+        if radius_km is not None:
+            nearest = [item for item in nearest if item[0] <= radius_km]
+        return [restaurant_id for distance, restaurant_id in nearest[:count]]
+
+    def test_matches_brute_force(self):
+        rng = np.random.default_rng(0)
+        points = np.column_stack([
+            rng.uniform(37.3, 37.9, 300), rng.uniform(55.5, 56.0, 300)
+        ])
+        restaurant_ids = list(range(1, 301))
+        index = RestaurantIndex(restaurant_ids, points)
+
+        for order_point in [(37.62, 55.75), (37.31, 55.51), (37.9, 56.0)]:
+            for count, radius_km in [(5, None), (5, 3), (None, 12), (1, 0.5), (None, 100)]:
+                found_ids, distances = index.nearest(
+                    order_point, count=count, radius_km=radius_km
+                )
+                self.assertEqual(
+                    list(found_ids),
+                    self.brute_force_nearest(
+                        order_point, restaurant_ids, points, count, radius_km
+                    ),
+                )
+                self.assertEqual(list(distances), sorted(distances))
+
+    def test_finds_restaurants_in_neighbour_cells(self):
+        index = RestaurantIndex([1, 2], [(37.0, 55.0), (37.01, 55.0)], cell_size_km=1)
+        self.assertNotEqual(index.get_cell(37.0, 55.0), index.get_cell(37.01, 55.0))
+
+        found_ids, distances = index.nearest((37.005, 55.0), radius_km=1)
+
+        self.assertCountEqual(found_ids, [1, 2])
+        self.assertTrue(all(distance < 0.5 for distance in distances))
+
+    def test_cells_around_zero_meridian(self):
+        index = RestaurantIndex([1, 2], [(-0.001, 51.5), (0.001, 51.5)])
+        found_ids, distances = index.nearest((0.0, 51.5), radius_km=0.1)
+        self.assertCountEqual(found_ids, [1, 2])
+
+    def test_radius_is_inclusive_and_excludes_farther(self):
+        index = RestaurantIndex([1, 2], [(37.62, 55.75), (37.62, 55.85)])
+        distance = haversine_matrix((37.62, 55.75), (37.62, 55.85))[0][0]
+
+        self.assertEqual(
+            list(index.nearest((37.62, 55.75), radius_km=distance)[0]), [1, 2]
+        )
+        self.assertEqual(
+            list(index.nearest((37.62, 55.75), radius_km=distance - 0.01)[0]), [1]
+        )
+
+    def test_allowed_ids_and_empty_index(self):
+        index = RestaurantIndex([1, 2, 3], [(37.6, 55.7), (37.61, 55.7), (37.62, 55.7)])
+
+        found_ids, distances = index.nearest((37.6, 55.7), allowed_ids={2, 3}, count=1)
+        self.assertEqual(list(found_ids), [2])
+
+        self.assertEqual(len(index.nearest((37.6, 55.7), allowed_ids=set())[0]), 0)
+        self.assertEqual(len(RestaurantIndex([], []).nearest((37.6, 55.7), radius_km=5)[0]), 0)
+
+
+class AvailabilityIndexCacheTest(TestCase):
+    def setUp(self):
+        restaurant = Restaurant.objects.create(name='Бургерная')
+        self.product = Product.objects.create(name='Бургер', price=100, image='burger.jpg')
+        RestaurantMenuItem.objects.create(restaurant=restaurant, product=self.product)
+        self.restaurant_ids = {restaurant.id}
+
+    def hide_product_in_another_process(self):
+        # update() sends no signals, like a change made by another process
+        RestaurantMenuItem.objects.update(availability=False)
+
+    def get_restaurant_ids(self):
+        return get_availability_index().get_restaurant_ids([self.product.id])
+
+    def test_rebuilt_when_another_process_bumps_version(self):
+        self.assertEqual(self.get_restaurant_ids(), self.restaurant_ids)
+        self.hide_product_in_another_process()
+        self.assertEqual(self.get_restaurant_ids(), self.restaurant_ids)
+
+        cache.set('availability_index:version', 'another')
+
+        self.assertEqual(self.get_restaurant_ids(), set())
+
+    def test_rebuilt_after_ttl(self):
+        with mock.patch('foodcartapp.models._availability_index.ttl', 0):
+            self.assertEqual(self.get_restaurant_ids(), self.restaurant_ids)
+            self.hide_product_in_another_process()
+            self.assertEqual(self.get_restaurant_ids(), set())
+
+
+class CatalogueCacheTest(TestCase):
+    def setUp(self):
+        restaurant = Restaurant.objects.create(name='Бургерная')
+        self.product = Product.objects.create(name='Бургер', price=100, image='burger.jpg')
+        RestaurantMenuItem.objects.create(restaurant=restaurant, product=self.product)
+
+    def test_cached_catalogue_is_served_without_queries(self):
+        first_response = self.client.get('/api/products/')
+
+        with self.assertNumQueries(0):
+            second_response = self.client.get('/api/products/')
+
+        self.assertEqual(second_response.content, first_response.content)
+        self.assertEqual(second_response['ETag'], first_response['ETag'])
+
+    def test_payload_is_loaded_once_and_not_for_not_modified(self):
+        etag = self.client.get('/api/products/')['ETag']
+
+        with mock.patch('foodcartapp.catalogue.cache', mock.Mock(wraps=cache)) as cache_mock:
+            self.client.get('/api/products/')
+            self.client.get('/api/products/', HTTP_IF_NONE_MATCH=etag)
+
+        read_keys = [call.args[0] for call in cache_mock.get.call_args_list]
+        payload_keys = [
+            key for key in read_keys
+            if key != 'catalogue:version' and not key.endswith(':headers')
+        ]
+        self.assertEqual(len(payload_keys), 1)
+        self.assertEqual(len(read_keys), 5)
+
+    def test_unchanged_catalogue_returns_not_modified(self):
+        etag = self.client.get('/api/products/')['ETag']
+
+        response = self.client.get('/api/products/', HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+    def test_product_change_bumps_version(self):
+        etag = self.client.get('/api/products/')['ETag']
+
+        self.product.price = 150
+        self.product.save()
+        response = self.client.get('/api/products/', HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.json()[0]['price'], '150.00')
+
+    def test_menu_change_bumps_version(self):
+        self.client.get('/api/products/')
+
+        RestaurantMenuItem.objects.get().delete()
+
+        self.assertEqual(self.client.get('/api/products/').json(), [])
+
+
+class OrderAdminTest(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser('admin', password='password'))
+        restaurant = Restaurant.objects.create(name='Бургерная', address='Арбат 1')
+        product = Product.objects.create(name='Бургер', price=100, image='burger.jpg')
+        RestaurantMenuItem.objects.create(restaurant=restaurant, product=product)
+        for address, lon, lat in [('Арбат 1', 37.59, 55.75), ('Кремль', 37.62, 55.75)]:
+            MapPoint.objects.create(
+                address=address,
+                address_key=normalize_address(address),
+                lon=lon,
+                lat=lat,
+                last_update=timezone.now(),
+            )
+        self.order = Order.objects.create(
+            firstname='Иван',
+            lastname='Петров',
+            phonenumber='+79291234567',
+            address='Кремль',
+        )
+        self.position = OrderPosition.objects.create(
+            order=self.order, product=product, current_price=100, quantity=2
+        )
+        Order.objects.update_restaurant_candidates()
+
+    def change_address(self, address):
+        created_time = timezone.localtime(self.order.created_time)
+        return self.client.post(
+            reverse('admin:foodcartapp_order_change', args=[self.order.id]),
+            {
+                'firstname': 'Иван',
+                'lastname': 'Петров',
+                'phonenumber': '+79291234567',
+                'address': address,
+                'status': Order.Status.NEW,
+                'payment_method': '',
+                'comment': '',
+                'created_time_0': created_time.strftime('%Y-%m-%d'),
+                'created_time_1': created_time.strftime('%H:%M:%S'),
+                'called_time_0': '',
+                'called_time_1': '',
+                'delivered_time_0': '',
+                'delivered_time_1': '',
+                'restaurant': '',
+                'product_positions-TOTAL_FORMS': '1',
+                'product_positions-INITIAL_FORMS': '1',
+                'product_positions-MIN_NUM_FORMS': '0',
+                'product_positions-MAX_NUM_FORMS': '1000',
+                'product_positions-0-id': str(self.position.id),
+                'product_positions-0-order': str(self.order.id),
+                'product_positions-0-current_price': '100',
+                'product_positions-0-quantity': '2',
+            },
+        )
+
+    def test_new_address_drops_old_candidates(self):
+        self.assertTrue(self.order.restaurant_candidates.exists())
+
+        response = self.change_address('Владивосток')
+
+        self.assertEqual(response.status_code, 302)
+        order = Order.objects.get()
+        self.assertEqual(order.address, 'Владивосток')
+        self.assertIsNone(order.candidates_updated_time)
+        self.assertFalse(order.restaurant_candidates.exists())
+        self.assertTrue(GeocodeJob.objects.filter(address='Владивосток').exists())
+
+    def test_known_new_address_is_ranked_again(self):
+        self.change_address('Арбат 1')
+
+        order = Order.objects.get()
+        self.assertIsNotNone(order.candidates_updated_time)
+        self.assertAlmostEqual(order.restaurant_candidates.get().distance, 0)
+
+
+class RegisterOrderIdempotencyTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        product = Product.objects.create(name='Бургер', price=100, image='burger.jpg')
+        self.order = {
+            'products': [{'product': product.id, 'quantity': 2}],
+            'firstname': 'Иван',
+            'lastname': 'Петров',
+            'phonenumber': '+79291234567',
+            'address': 'Москва, Тверская 1',
+        }
+
+    def post_order(self, order, key):
+        return self.client.post(
+            '/api/order/', order, format='json', HTTP_IDEMPOTENCY_KEY=key
+        )
+
+    def test_replayed_request_returns_original_response(self):
+        first_response = self.post_order(self.order, 'checkout-1')
+        second_response = self.post_order(self.order, 'checkout-1')
+
+        self.assertEqual(second_response.status_code, first_response.status_code)
+        self.assertEqual(second_response.json(), first_response.json())
+        self.assertEqual(second_response['Idempotent-Replayed'], 'true')
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_key_reused_for_another_order_is_rejected(self):
+        self.post_order(self.order, 'checkout-1')
+        response = self.post_order({**self.order, 'address': 'Арбат 10'}, 'checkout-1')
+
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_order_is_priced_from_database(self):
+        self.post_order(self.order, 'checkout-1')
+        # update() sends no signals, like a price change saved by another process
+        Product.objects.update(price=150)
+
+        response = self.post_order(self.order, 'checkout-2')
+
+        self.assertEqual(response.json()['total_amount'], '300.00')
+
+    def test_invalid_request_does_not_claim_key(self):
+        self.post_order({**self.order, 'products': []}, 'checkout-1')
+        response = self.post_order(self.order, 'checkout-1')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Order.objects.count(), 1)
+
+
+
+class OrderExportImportTest(TestCase):
+    def setUp(self):
+        products = [
+            Product.objects.create(name=f'Бургер {number}', price=100, image='burger.jpg')
+            for number in range(2)
+        ]
+        order = Order.objects.create(
+            firstname='Иван',
+            lastname='Петров',
+            phonenumber='+79291234567',
+            address='Москва, Тверская 1',
+            status=Order.Status.COMPLETE,
+            comment='Домофон не работает,\nзвоните',
+            called_time=timezone.now(),
+        )
+        OrderPosition.objects.bulk_create([
+            OrderPosition(order=order, product=products[0], quantity=2, current_price=90),
+            OrderPosition(order=order, product=products[1], quantity=1, current_price=100),
+        ])
+        Order.objects.create(
+            firstname='Пётр',
+            lastname='Иванов',
+            phonenumber='+79291234568',
+            address='Москва, Арбат 10',
+        )
+        Order.objects.recalculate_total_amount()
+
+    def dump_orders(self):
+        return [
+            (
+                order.firstname,
+                order.lastname,
+                str(order.phonenumber),
+                order.address,
+                order.status,
+                order.comment,
+                order.created_time,
+                order.called_time,
+                order.total_amount,
+                sorted(
+                    (position.product_id, position.quantity, position.current_price)
+                    for position in order.product_positions.all()
+                ),
+            )
+            for order in Order.objects.order_by('created_time').prefetch_related('product_positions')
+        ]
+
+    def assert_round_trip(self, file_format):
+        orders = self.dump_orders()
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, f'orders.{file_format}')
+            call_command('export_orders', path, stdout=StringIO())
+            Order.objects.all().delete()
+            call_command('import_orders', path, '--batch-size', '1', stdout=StringIO())
+
+        self.assertEqual(self.dump_orders(), orders)
+
+    def test_jsonl_round_trip(self):
+        self.assert_round_trip('jsonl')
+
+    def test_csv_round_trip(self):
+        self.assert_round_trip('csv')
+
+
+class MetricsTest(TestCase):
+    def setUp(self):
+        metrics.clear()
+
+    def test_requests_are_recorded_per_view(self):
+        self.client.get('/api/products/')
+
+        response = self.client.get('/metrics')
+
+        self.assertIn(
+            'http_requests_total{status="200",view="foodcartapp:product_list_api"} 1',
+            response.content.decode(),
+        )
+        self.assertIn(
+            'db_queries_total{view="foodcartapp:product_list_api"}',
+            response.content.decode(),
+        )
+
+    def test_metrics_of_other_processes_are_added_up(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        worker_metrics = MetricsRegistry()
+        worker_metrics.observe('geocoder_request_duration_seconds', 0.2, outcome='ok')
+        worker_metrics.inc('db_queries_total', 2, view='foodcartapp:product_list_api')
+        MetricsStore(directory).save(worker_metrics, force=True)
+
+        with mock.patch('foodcartapp.metrics.metrics_store', MetricsStore(directory)):
+            self.client.get('/api/products/')
+            self.client.get('/api/products/')
+            response = self.client.get('/metrics')
+
+        self.assertIn(
+            'geocoder_request_duration_seconds_count{outcome="ok"} 1',
+            response.content.decode(),
+        )
+        self.assertIn(
+            'http_requests_total{status="200",view="foodcartapp:product_list_api"} 2',
+            response.content.decode(),
+        )
+        self.assertIn(
+            'db_queries_total{view="foodcartapp:product_list_api"}',
+            response.content.decode(),
+        )
+        self.assertEqual(len([
+            filename for filename in os.listdir(directory) if filename.endswith('.json')
+        ]), 2)
+
+    def test_files_of_stopped_processes_are_archived(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        stopped_process = subprocess.Popen(['true'])
+        stopped_process.wait()
+        for run in range(2):
+            stopped_metrics = MetricsRegistry()
+            stopped_metrics.inc('geocoder_retries_total', 3)
+            with open(os.path.join(directory, f'{stopped_process.pid}-{run}.json'), 'w') as output:
+                json.dump(stopped_metrics.snapshot(), output)
+        running_metrics = MetricsRegistry()
+        running_metrics.inc('geocoder_retries_total', 1)
+        MetricsStore(directory).save(running_metrics, force=True)
+
+        for _ in range(2):
+            registry = MetricsStore(directory).load()
+            self.assertIn('geocoder_retries_total 7\n', registry.render())
+
+        self.assertEqual(sorted(
+            filename.split('-')[0] for filename in os.listdir(directory)
+            if filename.endswith('.json')
+        ), [str(os.getpid()), 'archive.json'])
+
+    def test_metrics_are_hidden_from_other_hosts(self):
+        response = self.client.get('/metrics', REMOTE_ADDR='10.0.0.1')
+        self.assertEqual(response.status_code, 403)
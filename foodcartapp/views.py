@@ -1,38 +1,56 @@
-from django.http import JsonResponse
+from django.http import HttpResponse, HttpResponseForbidden, JsonResponse
 from django.templatetags.static import static
 from django.db import transaction
+from django.views.decorators.http import condition
 
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
-from rest_framework.serializers import ModelSerializer
+from rest_framework.serializers import IntegerField, ModelSerializer
+from rest_framework.serializers import Serializer, ValidationError
 
+from star_burger.settings import METRICS_ALLOWED_IPS
 
-from .models import Product
-from .models import Order, OrderPosition, RestaurantMenuItem
+from .catalogue import get_catalogue_headers, get_catalogue_payload
+from .catalogue import get_product_prices
+from .idempotency import idempotent
+from .metrics import render_metrics
+from .models import Order, OrderPosition, GeocodeJob
 
 
-def get_product_restaurant(product):
-    menu_items = RestaurantMenuItem.objects \
-        .prefetch_related('product') \
-        .filter(availability=True) \
-        .order_by('product') \
-        .values_list('product', 'restaurant')
-
-    return set(rest for prod, rest in list(menu_items) if prod == product.id)
-
-
-class OrderPositionSerializer(ModelSerializer):
-    class Meta:
-        model = OrderPosition
-        fields = ['product', 'quantity']
+class OrderPositionSerializer(Serializer):
+    product = IntegerField(min_value=1)
+    quantity = IntegerField(min_value=1)
 
 
 class OrderSerializer(ModelSerializer):
-    products = OrderPositionSerializer(many=True, write_only=True)
+    products = OrderPositionSerializer(many=True, allow_empty=False, write_only=True)
 
     class Meta:
         model = Order
-        fields = '__all__'
+        fields = [
+            'id',
+            'firstname',
+            'lastname',
+            'phonenumber',
+            'address',
+            'total_amount',
+            'products',
+        ]
+        read_only_fields = ['id', 'total_amount']
+
+    def validate_products(self, positions):
+        product_ids = {position['product'] for position in positions}
+        prices = get_product_prices(product_ids)
+
+        unknown_ids = product_ids - set(prices)
+        if unknown_ids:
+            raise ValidationError(
+                f'Недопустимые id продуктов: {sorted(unknown_ids)}'
+            )
+
+        for position in positions:
+            position['current_price'] = prices[position['product']]
+        return positions
 
 
 def banners_list_api(request):
@@ -59,58 +77,59 @@ def banners_list_api(request):
     })
 
 
+def get_request_catalogue_headers(request):
+    # the condition functions and the view see one catalogue version
+    if not hasattr(request, 'catalogue_headers'):
+        request.catalogue_headers = get_catalogue_headers()
+    return request.catalogue_headers
+
+
+@condition(
+    etag_func=lambda request: get_request_catalogue_headers(request)['etag'],
+    last_modified_func=lambda request: get_request_catalogue_headers(request)['last_modified'],
+)
 def product_list_api(request):
-    products = Product.objects.select_related('category').available()
-
-    dumped_products = []
-    for product in products:
-        dumped_product = {
-            'id': product.id,
-            'name': product.name,
-            'price': product.price,
-            'special_status': product.special_status,
-            'description': product.description,
-            'category': {
-                'id': product.category.id,
-                'name': product.category.name,
-            },
-            'image': product.image.url,
-            'restaurant': {
-                'id': product.id,
-                'name': product.name,
-            }
-        }
-        dumped_products.append(dumped_product)
-    return JsonResponse(dumped_products, safe=False, json_dumps_params={
-        'ensure_ascii': False,
-        'indent': 4,
-    })
+    version = get_request_catalogue_headers(request)['version']
+    return HttpResponse(
+        get_catalogue_payload(version),
+        content_type='application/json',
+    )
 
 
-@transaction.atomic
 @api_view(['POST'])
+@idempotent
+@transaction.atomic
 def register_order(request):
-    raw_order = request.data
-    serializer = OrderSerializer(data=raw_order)
+    serializer = OrderSerializer(data=request.data)
     serializer.is_valid(raise_exception=True)
-    validated_data = serializer.validated_data
-    products_fields = list(validated_data['products'])
-
-    for field in products_fields:
-        field['current_price'] = field['product'].price
+    order_fields = dict(serializer.validated_data)
+    positions = order_fields.pop('products')
 
     order = Order.objects.create(
-        address=validated_data['address'],
-        firstname=validated_data['firstname'],
-        lastname=validated_data['lastname'],
-        phonenumber=validated_data['phonenumber'],
+        **order_fields,
+        total_amount=sum(
+            position['current_price'] * position['quantity']
+            for position in positions
+        ),
+    )
+    OrderPosition.objects.bulk_create([
+        OrderPosition(
+            order=order,
+            product_id=position['product'],
+            quantity=position['quantity'],
+            current_price=position['current_price'],
+        )
+        for position in positions
+    ])
+    GeocodeJob.objects.enqueue(order.address)
+
+    return Response(OrderSerializer(instance=order).data)
+
+
+def metrics_view(request):
+    if request.META.get('REMOTE_ADDR') not in METRICS_ALLOWED_IPS:
+        return HttpResponseForbidden()
+    return HttpResponse(
+        render_metrics(),
+        content_type='text/plain; version=0.0.4; charset=utf-8',
     )
-
-    products = [
-        OrderPosition(order=order, **fields) for fields in products_fields
-    ]
-
-    OrderPosition.objects.bulk_create(products)
-    response = OrderSerializer(instance=order)
-
-    return Response(response.data)
@@ -1,3 +1,182 @@
+import json
+from datetime import datetime
+
+from django.contrib.auth.models import User
 from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from foodcartapp.models import MapPoint, Order, OrderEvent, OrderPosition, Product
+from foodcartapp.models import Restaurant, RestaurantMenuItem
+
+
+class ManagerOrdersQueriesTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager = User.objects.create_user(
+            'manager', password='password', is_staff=True
+        )
+        restaurant = Restaurant.objects.create(name='Бургерная', address='Арбат 1')
+        cls.products = [
+            Product.objects.create(name=f'Бургер {number}', price=100, image='burger.jpg')
+            for number in range(3)
+        ]
+        for product in cls.products:
+            RestaurantMenuItem.objects.create(restaurant=restaurant, product=product)
+
+        for address, lon, lat in [('Арбат 1', 37.59, 55.75), ('Кремль', 37.62, 55.75)]:
+            MapPoint.objects.create(
+                address=address,
+                address_key=address.lower(),
+                lon=lon,
+                lat=lat,
+                last_update=timezone.now(),
+            )
+
+    def create_orders(self, count):
+        for _ in range(count):
+            order = Order.objects.create(
+                firstname='Иван',
+                lastname='Петров',
+                phonenumber='+79291234567',
+                address='Кремль',
+            )
+            OrderPosition.objects.bulk_create([
+                OrderPosition(order=order, product=product, current_price=100, quantity=2)
+                for product in self.products
+            ])
+        Order.objects.recalculate_total_amount()
+        Order.objects.update_restaurant_candidates()
+
+    def test_dashboard_queries_do_not_depend_on_orders_count(self):
+        self.create_orders(10)
+
+        with self.assertNumQueries(3):
+            orders = list(Order.objects.for_manager_dashboard())
+            for order in orders:
+                list(order.product_positions.all())
+                list(order.restaurant_candidates.all())
+
+        self.assertEqual(len(orders), 10)
+        self.assertEqual(orders[0].total_amount, 600)
+        self.assertEqual(orders[0].restaurant_candidates.all()[0].restaurant.name, 'Бургерная')
+
+    def test_orders_page_queries_do_not_depend_on_orders_count(self):
+        self.client.force_login(self.manager)
+        self.create_orders(1)
+        self.client.get(reverse('restaurateur:view_orders'))
+
+        self.create_orders(20)
+        with self.assertNumQueries(10):
+            response = self.client.get(reverse('restaurateur:view_orders'))
+
+        self.assertEqual(len(response.context['orders']), 21)
+
+    def test_orders_feed_streams_orders_with_candidates(self):
+        self.client.force_login(self.manager)
+        self.create_orders(3)
+
+        response = self.client.get(reverse('restaurateur:orders_feed'))
+
+        self.assertTrue(response.streaming)
+        orders = json.loads(b''.join(response.streaming_content))
+        self.assertEqual(len(orders), 3)
+        self.assertEqual(orders[0]['total_amount'], '600.00')
+        self.assertEqual(orders[0]['restaurant_candidates'][0]['name'], 'Бургерная')
+
+    def test_impossible_cursor_is_ignored(self):
+        self.client.force_login(self.manager)
+        self.create_orders(1)
+
+        for cursor in ['2026-13-45T00:00:00_5', '2026-10-18T25:00:00_5', 'abc']:
+            response = self.client.get(reverse('restaurateur:view_orders'), {'after': cursor})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.context['orders']), 1)
+
+    def test_date_filter_uses_local_day_boundaries(self):
+        self.client.force_login(self.manager)
+        self.create_orders(3)
+        moscow = timezone.get_current_timezone()
+        for order, created_time in zip(Order.objects.order_by('id'), [
+            datetime(2026, 10, 16, 23, 59),
+            datetime(2026, 10, 17, 0, 0),
+            datetime(2026, 10, 18, 0, 0),
+        ]):
+            order.created_time = timezone.make_aware(created_time, moscow)
+            order.save()
+
+        response = self.client.get(reverse('restaurateur:view_orders'), {
+            'created_from': '2026-10-17',
+            'created_to': '2026-10-17',
+        })
+
+        self.assertEqual(
+            [order.created_time for order in response.context['orders']],
+            [timezone.make_aware(datetime(2026, 10, 17, 0, 0), moscow)],
+        )
+
+    def test_order_events_resume_after_last_event_id(self):
+        self.client.force_login(self.manager)
+        self.create_orders(1)
+        last_event_id = OrderEvent.objects.last_id()
+
+        self.create_orders(1)
+        deleted_order = Order.objects.first()
+        deleted_order.delete()
+
+        response = self.client.get(
+            reverse('restaurateur:order_events'),
+            HTTP_LAST_EVENT_ID=str(last_event_id),
+        )
+        stream = response.content.decode()
+
+        messages = [message for message in stream.split('\n\n') if message.startswith('event:')]
+        self.assertEqual(len(messages), 2)
+        self.assertTrue(messages[0].startswith('event: created'))
+        self.assertIn(f'"id":{Order.objects.get().id}', messages[0])
+        self.assertTrue(messages[1].startswith('event: deleted'))
+        self.assertIn(f'id: {OrderEvent.objects.last_id()}', messages[1])
+
+
+    def test_order_events_end_with_last_event_id(self):
+        self.client.force_login(self.manager)
+        self.create_orders(1)
+        last_event_id = OrderEvent.objects.last_id()
+
+        response = self.client.get(reverse('restaurateur:order_events'))
+
+        self.assertEqual(response.content.decode(), f'retry: 2000\n\nid: {last_event_id}\n\n')
+
+
+class ManagerProductsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager = User.objects.create_user(
+            'manager', password='password', is_staff=True
+        )
+        cls.restaurants = [
+            Restaurant.objects.create(name=name) for name in ['Арбат', 'Бутово']
+        ]
+        cls.products = [
+            Product.objects.create(name=f'Бургер {number}', price=100, image='burger.jpg')
+            for number in range(3)
+        ]
+        RestaurantMenuItem.objects.create(
+            restaurant=cls.restaurants[0], product=cls.products[0]
+        )
+        RestaurantMenuItem.objects.create(
+            restaurant=cls.restaurants[1], product=cls.products[1], availability=False
+        )
+
+    def test_products_page_shows_availability_matrix(self):
+        self.client.force_login(self.manager)
+        self.client.get(reverse('restaurateur:ProductsView'))
+
+        with self.assertNumQueries(5):
+            response = self.client.get(reverse('restaurateur:ProductsView'))
 
-# Create your tests here.
+        self.assertEqual(response.context['products_with_restaurants'], [
+            (self.products[0], [True, False]),
+            (self.products[1], [False, False]),
+            (self.products[2], [False, False]),
+        ])
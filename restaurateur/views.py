@@ -1,4 +1,10 @@
+from datetime import datetime, timedelta
+from itertools import groupby
+
 from django import forms
+from django.core.paginator import Paginator
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse
 from django.shortcuts import redirect, render
 from django.views import View
 from django.urls import reverse_lazy
@@ -6,8 +12,13 @@ from django.contrib.auth.decorators import user_passes_test
 
 from django.contrib.auth import authenticate, login
 from django.contrib.auth import views as auth_views
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 
+from foodcartapp.models import OrderEvent, OrderRestaurantCandidate
 from foodcartapp.models import Product, Restaurant, Order
+from foodcartapp.models import get_availability_index
+from foodcartapp.streaming import StreamingJsonResponse, chunked
 
 
 class Login(forms.Form):
@@ -62,29 +73,29 @@ def is_manager(user):
     return user.is_staff  # FIXME replace with specific permission
 
 
+PRODUCTS_PAGE_SIZE = 100
+
+
 @user_passes_test(is_manager, login_url='restaurateur:login')
 def view_products(request):
     restaurants = list(Restaurant.objects.order_by('name'))
-    products = list(Product.objects.prefetch_related('menu_items'))
-
-    default_availability = {restaurant.id: False for restaurant in restaurants}
-    products_with_restaurants = []
-    for product in products:
+    restaurant_ids = [restaurant.id for restaurant in restaurants]
 
-        availability = {
-            **default_availability,
-            **{item.restaurant_id: item.availability for item in product.menu_items.all()},
-        }
-        orderer_availability = [availability[restaurant.id]
-                                for restaurant in restaurants]
+    products_page = Paginator(
+        Product.objects.select_related('category').order_by('id'),
+        PRODUCTS_PAGE_SIZE,
+    ).get_page(request.GET.get('page'))
 
-        products_with_restaurants.append(
-            (product, orderer_availability)
-        )
+    availability_index = get_availability_index()
+    products_with_restaurants = [
+        (product, availability_index.get_row(product.id, restaurant_ids))
+        for product in products_page
+    ]
 
     return render(request, template_name="products_list.html", context={
         'products_with_restaurants': products_with_restaurants,
         'restaurants': restaurants,
+        'products_page': products_page,
     })
 
 
@@ -95,13 +106,247 @@ def view_restaurants(request):
     })
 
 
+def get_day_start(day):
+    return timezone.make_aware(datetime.combine(day, datetime.min.time()))
+
+
+class OrdersFilter(forms.Form):
+    status = forms.MultipleChoiceField(
+        label='Статус', required=False,
+        choices=Order.Status.choices,
+        widget=forms.CheckboxSelectMultiple,
+    )
+    restaurant = forms.ModelChoiceField(
+        label='Ресторан', required=False,
+        queryset=Restaurant.objects.order_by('name'),
+        widget=forms.Select(attrs={'class': 'form-control'}),
+    )
+    created_from = forms.DateField(
+        label='Создан с', required=False,
+        widget=forms.DateInput(attrs={'class': 'form-control', 'type': 'date'}),
+    )
+    created_to = forms.DateField(
+        label='Создан по', required=False,
+        widget=forms.DateInput(attrs={'class': 'form-control', 'type': 'date'}),
+    )
+
+    def filter(self, orders):
+        statuses = self.cleaned_data['status'] \
+            or [Order.Status.NEW, Order.Status.IN_PROGRESS]
+        orders = orders.filter(status__in=statuses)
+
+        if self.cleaned_data['restaurant']:
+            orders = orders.filter(restaurant=self.cleaned_data['restaurant'])
+        # compare with day boundaries rather than the date of created_time,
+        # so the (status, created_time, id) index serves the range
+        if self.cleaned_data['created_from']:
+            orders = orders.filter(
+                created_time__gte=get_day_start(self.cleaned_data['created_from'])
+            )
+        if self.cleaned_data['created_to']:
+            orders = orders.filter(
+                created_time__lt=get_day_start(
+                    self.cleaned_data['created_to'] + timedelta(days=1)
+                )
+            )
+        return orders
+
+
+ORDERS_PAGE_SIZE = 50
+
+
+def encode_orders_cursor(order):
+    return f'{order.created_time.isoformat()}_{order.id}'
+
+
+def decode_orders_cursor(cursor):
+    created_time, _, order_id = cursor.rpartition('_')
+    try:
+        created_time = parse_datetime(created_time)
+    except ValueError:
+        # well formed, but not a real date or time
+        return None
+    if not created_time or not order_id.isdigit():
+        return None
+    return created_time, int(order_id)
+
+
 @user_passes_test(is_manager, login_url='restaurateur:login')
 def view_orders(request):
-    orders = Order.objects \
-        .prefetch_related('products', 'restaurants') \
-        .total() \
-        .fetch_restaurant_distance()
+    orders_filter = OrdersFilter(request.GET)
+    orders = orders_filter.filter(Order.objects.all()) \
+        if orders_filter.is_valid() else Order.objects.none()
+
+    cursor = decode_orders_cursor(request.GET.get('after', ''))
+    if cursor:
+        orders = orders.older_than(*cursor)
+
+    page_ids = list(
+        orders
+        .order_by('-created_time', '-id')
+        .values_list('id', flat=True)[:ORDERS_PAGE_SIZE + 1]
+    )
+    has_next_page = len(page_ids) > ORDERS_PAGE_SIZE
+    page_ids = page_ids[:ORDERS_PAGE_SIZE]
+
+    Order.objects \
+        .filter(id__in=page_ids) \
+        .stale_candidates() \
+        .update_restaurant_candidates()
+
+    orders = list(
+        Order.objects
+        .filter(id__in=page_ids)
+        .order_by('-created_time', '-id')
+        .for_manager_dashboard()
+    )
+
+    next_page_query = None
+    if has_next_page:
+        next_page_query = request.GET.copy()
+        next_page_query['after'] = encode_orders_cursor(orders[-1])
+        next_page_query = next_page_query.urlencode()
 
     return render(request, template_name="order_items.html", context={
         'orders': orders,
+        'orders_filter': orders_filter,
+        'next_page_query': next_page_query,
+        'order_statuses': dict(Order.Status.choices),
     })
+
+
+ORDERS_FEED_CHUNK_SIZE = 500
+ORDERS_FEED_FIELDS = [
+    'id',
+    'status',
+    'firstname',
+    'lastname',
+    'phonenumber',
+    'address',
+    'total_amount',
+    'created_time',
+    'restaurant_id',
+    'candidates_updated_time',
+]
+
+
+def iterate_orders_feed(orders, chunk_size=ORDERS_FEED_CHUNK_SIZE):
+    order_values = orders \
+        .order_by('-created_time', '-id') \
+        .values(*ORDERS_FEED_FIELDS) \
+        .iterator(chunk_size=chunk_size)
+
+    for orders_chunk in chunked(order_values, chunk_size):
+        candidates = OrderRestaurantCandidate.objects \
+            .filter(order_id__in=[order['id'] for order in orders_chunk]) \
+            .order_by('order_id', 'distance') \
+            .values('order_id', 'restaurant_id', 'restaurant__name', 'distance')
+
+        order_candidates = {
+            order_id: [
+                {
+                    'restaurant': candidate['restaurant_id'],
+                    'name': candidate['restaurant__name'],
+                    'distance': candidate['distance'],
+                }
+                for candidate in candidates
+            ]
+            for order_id, candidates in groupby(candidates, lambda candidate: candidate['order_id'])
+        }
+        for order in orders_chunk:
+            order['phonenumber'] = str(order['phonenumber'])
+            order['restaurant_candidates'] = order_candidates.get(order['id'], [])
+            yield order
+
+
+@user_passes_test(is_manager, login_url='restaurateur:login')
+def orders_feed(request):
+    orders_filter = OrdersFilter(request.GET)
+    orders = orders_filter.filter(Order.objects.all()) \
+        if orders_filter.is_valid() else Order.objects.none()
+    return StreamingJsonResponse(iterate_orders_feed(orders))
+
+
+ORDER_EVENTS_RETRY_INTERVAL = 2
+ORDER_EVENTS_BATCH_SIZE = 500
+ORDER_EVENTS_MAX_BATCHES = 10
+
+
+def format_server_event(kind, data, event_id=None):
+    message = f'event: {kind}\n'
+    if event_id is not None:
+        message += f'id: {event_id}\n'
+    data = DjangoJSONEncoder(ensure_ascii=False, separators=(',', ':')).encode(data)
+    return f'{message}data: {data}\n\n'
+
+
+def iterate_order_events(last_event_id):
+    """Yield Server-Sent Events with the orders changed after `last_event_id`.
+
+    Only the events already in the log are sent, and the response ends:
+    the browser reconnects after the `retry` interval with the last id
+    it got, so an open orders page never holds a web server thread.
+    The response ends with that id on its own, so a browser that got
+    no events still resumes from here.
+
+    Several events of one order collapse into a single message with
+    the order's current state, sent as `created` if the order was
+    created within the batch. Only the last message of a batch carries
+    the event id, so a client reconnecting mid-batch gets it again
+    rather than skipping part of it.
+    """
+    yield f'retry: {ORDER_EVENTS_RETRY_INTERVAL * 1000}\n\n'
+
+    for _ in range(ORDER_EVENTS_MAX_BATCHES):
+        events = list(
+            OrderEvent.objects
+            .after(last_event_id)
+            .values_list('id', 'order_id', 'kind')[:ORDER_EVENTS_BATCH_SIZE]
+        )
+        if not events:
+            break
+
+        last_event_id = events[-1][0]
+        order_kinds = {}
+        for event_id, order_id, kind in events:
+            if order_kinds.get(order_id) != OrderEvent.Kind.CREATED:
+                order_kinds[order_id] = kind
+        orders = {
+            order['id']: order
+            for order in iterate_orders_feed(Order.objects.filter(id__in=order_kinds))
+        }
+
+        messages = []
+        for order_id, kind in order_kinds.items():
+            if order_id not in orders:
+                messages.append((OrderEvent.Kind.DELETED, {'id': order_id}))
+            else:
+                messages.append((kind, orders[order_id]))
+        for number, (kind, order) in enumerate(messages, start=1):
+            yield format_server_event(
+                kind,
+                order,
+                last_event_id if number == len(messages) else None,
+            )
+
+        if len(events) < ORDER_EVENTS_BATCH_SIZE:
+            break
+
+    yield f'id: {last_event_id}\n\n'
+
+
+@user_passes_test(is_manager, login_url='restaurateur:login')
+def order_events(request):
+    last_event_id = request.META.get('HTTP_LAST_EVENT_ID') \
+        or request.GET.get('last_event_id', '')
+    if last_event_id.isdigit():
+        last_event_id = int(last_event_id)
+    else:
+        last_event_id = OrderEvent.objects.last_id()
+
+    response = HttpResponse(
+        ''.join(iterate_order_events(last_event_id)),
+        content_type='text/event-stream; charset=utf-8',
+    )
+    response['Cache-Control'] = 'no-cache'
+    return response
@@ -17,7 +17,36 @@ SECRET_KEY = env('SECRET_KEY', 'etirgvonenrfnoerngorenogneongg334g')
 DEBUG = env.bool('DEBUG', True)
 
 ALLOWED_HOSTS = env.list('ALLOWED_HOSTS', ['127.0.0.1', 'localhost'])
-YANDEX_API_KEY = env.str('YANDEX_API_KEY')
+YANDEX_API_KEY = env.str('YANDEX_API_KEY', None)
+GEOCODER_BACKEND = env.str('GEOCODER_BACKEND', 'yandex')
+GEOCODER_URL = env.str(
+    'GEOCODER_URL',
+    'http://127.0.0.1:8001/1.x' if GEOCODER_BACKEND == 'stub'
+    else 'https://geocode-maps.yandex.ru/1.x'
+)
+GEOCODER_OFFLINE_FILE = env.str('GEOCODER_OFFLINE_FILE', None)
+GEOCODER_OFFLINE_FALLBACK = env.bool('GEOCODER_OFFLINE_FALLBACK', True)
+GEOCODER_WORKERS = env.int('GEOCODER_WORKERS', 4)
+GEOCODER_RATE_LIMIT = env.float('GEOCODER_RATE_LIMIT', 10)
+GEOCODER_CONNECT_TIMEOUT = env.float('GEOCODER_CONNECT_TIMEOUT', 3)
+GEOCODER_READ_TIMEOUT = env.float('GEOCODER_READ_TIMEOUT', 10)
+GEOCODER_RETRIES = env.int('GEOCODER_RETRIES', 2)
+GEOCODER_CIRCUIT_FAILURES = env.int('GEOCODER_CIRCUIT_FAILURES', 5)
+GEOCODER_CIRCUIT_RESET = env.float('GEOCODER_CIRCUIT_RESET', 30)
+
+GEOCODE_CACHE_SIZE = env.int('GEOCODE_CACHE_SIZE', 1024)
+GEOCODE_CACHE_TTL = env.int('GEOCODE_CACHE_TTL', 30 * 24 * 60 * 60)
+GEOCODE_NEGATIVE_CACHE_TTL = env.int('GEOCODE_NEGATIVE_CACHE_TTL', 24 * 60 * 60)
+
+DISTANCE_MODE = env.str('DISTANCE_MODE', 'haversine')
+DELIVERY_RADIUS_KM = env.float('DELIVERY_RADIUS_KM', None)
+NEAREST_RESTAURANTS_COUNT = env.int('NEAREST_RESTAURANTS_COUNT', 5)
+
+CATALOGUE_CACHE_TIMEOUT = env.int('CATALOGUE_CACHE_TIMEOUT', 5 * 60)
+INDEX_CACHE_TTL = env.int('INDEX_CACHE_TTL', 60)
+IDEMPOTENCY_KEY_TTL = env.int('IDEMPOTENCY_KEY_TTL', 24 * 60 * 60)
+METRICS_ALLOWED_IPS = env.list('METRICS_ALLOWED_IPS', ['127.0.0.1'])
+METRICS_DIR = env.str('METRICS_DIR', None)
 
 INSTALLED_APPS = [
     'foodcartapp.apps.FoodcartappConfig',
@@ -28,12 +57,12 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
-    'debug_toolbar',
     'phonenumber_field',
     'rest_framework'
 ]
 
 MIDDLEWARE = [
+    'foodcartapp.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -41,9 +70,12 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    'debug_toolbar.middleware.DebugToolbarMiddleware',
 ]
 
+if DEBUG:
+    INSTALLED_APPS.append('debug_toolbar')
+    MIDDLEWARE.append('debug_toolbar.middleware.DebugToolbarMiddleware')
+
 ROOT_URLCONF = 'star_burger.urls'
 
 DEBUG_TOOLBAR_PANELS = [
@@ -90,6 +122,13 @@ DATABASES = {
     )
 }
 
+CACHES = {
+    'default': {
+        'BACKEND': env.str('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': env.str('CACHE_LOCATION', ''),
+    }
+}
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -19,6 +19,8 @@ from django.contrib import admin
 from django.urls import path, include
 from django.shortcuts import render
 
+from foodcartapp.views import metrics_view
+
 from . import settings
 
 urlpatterns = [
@@ -27,6 +29,7 @@ urlpatterns = [
     path('api/order/', include('rest_framework.urls')),
     path('api/', include('foodcartapp.urls')),
     path('manager/', include('restaurateur.urls')),
+    path('metrics', metrics_view, name='metrics'),
     
 ] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
 